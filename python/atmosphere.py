@@ -0,0 +1,94 @@
+import math
+
+
+class Atmosphere():
+    """
+    The density (relative to sea level) and the horizontal wind of the
+    atmosphere over the height. The density follows the layers of the
+    standard atmosphere (the temperature changes linearly within each
+    layer). Both are computed once into lookup tables at heights 0, STEP,
+    2*STEP, ... up to TOP and interpolated linearly, so that a lookup costs
+    no powers or exponentials. Below the ground the values at height 0
+    apply, above TOP there is no air.
+    The tables (heights, densities, winds) are plain lists, so that they
+    can also be used for arrays of heights, e.g., with numpy.interp.
+    The heights passed to density and wind are y coordinates in the pymunk
+    Space, whose origin is at the world height origin.
+    """
+
+    # layers of the standard atmosphere: (base height in m, temperature
+    # gradient in K/m), the last one reaches up to TOP
+    LAYERS = [(0, -6.5e-3), (11e3, 0), (20e3, 1e-3), (32e3, 2.8e-3),
+              (47e3, 0), (51e3, -2.8e-3), (71e3, -2e-3)]
+    TEMPERATURE = 288.15  # at sea level, in K
+    GMR = 0.0341632  # g * M / R of air, in K/m
+    TOP = 100e3  # the edge of the atmosphere, in m
+    STEP = 100  # height step of the lookup tables, in m
+    # wind profile (power law), the wind blows at the given speed
+    # at WIND_HEIGHT and vanishes at the ground
+    WIND_HEIGHT = 1000  # in m
+    WIND_EXPONENT = 1 / 7
+
+    def __init__(self, wind=0):
+        # wind speed at WIND_HEIGHT, in m/s (positive to the right)
+        self.wind_speed = wind
+        # world height of the origin of the Space, in m
+        self.origin = 0
+        n = int(self.TOP / self.STEP) + 1
+        self.heights = [i * self.STEP for i in range(n)]
+        self.densities = [self.standard_density(h) for h in self.heights]
+        self.densities[-1] = 0
+        self.winds = [wind * (h / self.WIND_HEIGHT) ** self.WIND_EXPONENT
+                      for h in self.heights]
+
+    # the density of the standard atmosphere at a given height, relative to
+    # sea level (the barometric formula, layer by layer)
+    def standard_density(self, height):
+        temperature = self.TEMPERATURE
+        pressure = 1
+        bounds = [base for base, _ in self.LAYERS[1:]] + [math.inf]
+        for (base, gradient), top in zip(self.LAYERS, bounds):
+            dh = min(height, top) - base
+            if gradient == 0:
+                pressure *= math.exp(-self.GMR * dh / temperature)
+            else:
+                t = temperature + gradient * dh
+                pressure *= (temperature / t) ** (self.GMR / gradient)
+                temperature = t
+            if height <= top:
+                break
+        return pressure * self.TEMPERATURE / temperature
+
+    # linear interpolation in a lookup table at a given height
+    def lookup(self, table, height):
+        x = height / self.STEP
+        if x <= 0:
+            return table[0]
+        i = int(x)
+        if i >= len(table) - 1:
+            return table[-1]
+        a = table[i]
+        return a + (table[i + 1] - a) * (x - i)
+
+    # the density of the air at a given height, relative to sea level
+    # (lookup inlined, this is called for every object at every step)
+    def density(self, height):
+        x = (height + self.origin) / self.STEP
+        if x <= 0:
+            return 1.
+        i = int(x)
+        table = self.densities
+        if i >= len(table) - 1:
+            return 0.
+        a = table[i]
+        return a + (table[i + 1] - a) * (x - i)
+
+    # the horizontal velocity of the air at a given height, in m/s
+    def wind(self, height):
+        if not self.wind_speed:
+            return 0
+        return self.lookup(self.winds, height + self.origin)
+
+
+# the atmosphere of objects that are not part of a game
+STANDARD_ATMOSPHERE = Atmosphere()
@@ -0,0 +1,249 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from multiprocessing import Pool
+import numpy as np
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+from pilot import Autopilot  # noqa: E402
+from tests import ALL_TESTS  # noqa: E402
+from batch import run_scenario  # noqa: E402
+
+
+class Autotuner():
+    """
+    Tunes gains of the autopilot (see Autopilot.GAINS) on the landing test
+    scenarios. A candidate is a vector of the logarithms of the gains
+    relative to their defaults, so that all gains stay positive and are
+    searched on the same scale. To evaluate a candidate, all scenarios run
+    in parallel headless games (see batch.run_scenario), and its score
+    (the fuel used plus penalties for hard touchdowns and for scenarios
+    that are unfinished or end with the rocket not upright, lower is
+    better) is cached by a hash of the gains, so that
+    no candidate is simulated twice, also across runs with a cache file.
+    The search is a Nelder-Mead simplex search, which needs no gradients
+    and only one or two evaluations per iteration. By default, it tunes
+    the gains that the SAS modes of the scenarios read (see
+    Autopilot.MODE_GAINS), the others would only add flat dimensions.
+    The cache keys include a fingerprint of the scenarios and of the code,
+    so that cached scores expire when either changes.
+    """
+
+    MAX_TIME = 60  # maximum simulated time per scenario, in seconds
+    SAFE_TOUCHDOWN = 10  # touchdown velocity without penalty, in m/s
+    TOUCHDOWN_PENALTY = 1e3  # in kg per m/s above SAFE_TOUCHDOWN
+    FAILURE_PENALTY = 1e6  # per unfinished or toppled scenario, in kg
+    INITIAL_STEP = 0.3  # size of the initial simplex, in log space
+    DIGITS = 4  # significant digits of the gains (this sets the cache keys)
+    TOLERANCE = 1  # spread of the scores at which the search stops, in kg
+
+    def __init__(self, names=None, sas_mode=None, processes=None,
+                 cache_file=None, log=sys.stdout):
+        self.sas_mode = sas_mode
+        # names and default values of the tuned gains, only gains that the
+        # tested SAS modes read can be tuned
+        used = self.used_gains()
+        if names is None:
+            names = used
+        unused = [name for name in names if name not in used]
+        if unused:
+            raise ValueError(f"the tested SAS modes do not read the gains "
+                             f"{', '.join(unused)}")
+        self.names = list(names)
+        self.defaults = np.array([Autopilot.GAINS[name]
+                                  for name in self.names], dtype=float)
+        self.fingerprint = self.code_fingerprint()
+        # stream for the progress of the search (None for no output)
+        self.log = log
+        self.pool = Pool(processes)
+        # the cache: {hash of the gains: {"gains", "score", "results"}}
+        self.cache_file = cache_file
+        self.cache = {}
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file) as f:
+                self.cache = json.load(f)
+        # statistics: number of evaluations and of simulated candidates
+        self.evaluations = 0
+        self.simulations = 0
+
+    # the gains read by the SAS modes of the scenarios (in the order of
+    # Autopilot.GAINS), the "land" mode is replaced by sas_mode (as in
+    # batch.run_scenario)
+    def used_gains(self):
+        used = set()
+        for test in ALL_TESTS:
+            sas_mode = test.sas_mode
+            if self.sas_mode is not None and sas_mode == "land":
+                sas_mode = self.sas_mode
+            used.update(Autopilot.MODE_GAINS[sas_mode])
+        return [name for name in Autopilot.GAINS if name in used]
+
+    # a fingerprint of the scenarios and of the code of the loaded modules
+    # of this directory (the game, the autopilot, the scoring, ...)
+    @staticmethod
+    def code_fingerprint():
+        h = hashlib.sha1()
+        for test in ALL_TESTS:
+            h.update(repr((
+                tuple(test.rocket_position), tuple(test.rocket_velocity),
+                test.rocket_angle, test.rocket_angular_velocity,
+                test.sas_mode, test.ignore_height)).encode())
+        directory = os.path.dirname(os.path.abspath(__file__))
+        files = set()
+        for module in list(sys.modules.values()):
+            path = getattr(module, "__file__", None)
+            if path and path.endswith(".py") and os.path.isfile(path) and \
+                    os.path.dirname(os.path.abspath(path)) == directory:
+                files.add(os.path.basename(path))
+        for name in sorted(files):
+            with open(os.path.join(directory, name), "rb") as f:
+                h.update(name.encode() + f.read())
+        return h.hexdigest()
+
+    # the gains of a candidate
+    def gains(self, x):
+        values = self.defaults * np.exp(x)
+        return {name: float(f"{value:.{self.DIGITS}g}")
+                for name, value in zip(self.names, values)}
+
+    # the cache key of a set of gains (and of the evaluation settings,
+    # scenarios and code)
+    def key(self, gains):
+        data = json.dumps([self.fingerprint, self.sas_mode, self.MAX_TIME,
+                           sorted(gains.items())])
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    # the score of the results of all scenarios
+    def score(self, results):
+        score = 0
+        for r in results:
+            score += r["fuel_used"]
+            if not (r["finished"] and r["upright"]):
+                score += self.FAILURE_PENALTY
+            v = r["touchdown_velocity"]
+            if v is not None and v > self.SAFE_TOUCHDOWN:
+                score += self.TOUCHDOWN_PENALTY * (v - self.SAFE_TOUCHDOWN)
+        return score
+
+    # the score of a candidate, simulated or from the cache
+    def evaluate(self, x):
+        self.evaluations += 1
+        gains = self.gains(x)
+        key = self.key(gains)
+        cached = key in self.cache
+        if not cached:
+            args = [(n, self.MAX_TIME, None, self.sas_mode, gains)
+                    for n in range(len(ALL_TESTS))]
+            results = self.pool.starmap(run_scenario, args, chunksize=1)
+            self.cache[key] = {"gains": gains, "score": self.score(results),
+                               "results": results}
+            self.simulations += 1
+            self.save()
+        score = self.cache[key]["score"]
+        self.report(gains, score, cached)
+        return score
+
+    # write the cache to the cache file (if any)
+    def save(self):
+        if self.cache_file:
+            with open(self.cache_file, "w") as f:
+                json.dump(self.cache, f)
+
+    # search for the best gains with at most max_evaluations evaluations,
+    # starting from the defaults, returns the best gains and their score
+    def search(self, max_evaluations=100):
+        n = len(self.names)
+        simplex = [np.zeros(n)] + [self.INITIAL_STEP * np.eye(n)[i]
+                                   for i in range(n)]
+        scores = []
+        for x in simplex:
+            scores.append(self.evaluate(x))
+        while self.evaluations < max_evaluations:
+            order = np.argsort(scores)
+            simplex = [simplex[i] for i in order]
+            scores = [scores[i] for i in order]
+            if scores[-1] - scores[0] < self.TOLERANCE:
+                break
+            centroid = np.mean(simplex[:-1], axis=0)
+            worst = simplex[-1]
+            # reflect the worst point through the centroid of the others
+            xr = centroid + (centroid - worst)
+            fr = self.evaluate(xr)
+            if fr < scores[0]:
+                # expand further in the same direction
+                xe = centroid + 2 * (centroid - worst)
+                fe = self.evaluate(xe)
+                simplex[-1], scores[-1] = (xe, fe) if fe < fr else (xr, fr)
+            elif fr < scores[-2]:
+                simplex[-1], scores[-1] = xr, fr
+            else:
+                # contract towards the better of the worst and reflected point
+                if fr < scores[-1]:
+                    xc = centroid + 0.5 * (xr - centroid)
+                else:
+                    xc = centroid + 0.5 * (worst - centroid)
+                fc = self.evaluate(xc)
+                if fc < min(fr, scores[-1]):
+                    simplex[-1], scores[-1] = xc, fc
+                else:
+                    # shrink towards the best point
+                    best = simplex[0]
+                    for i in range(1, n + 1):
+                        simplex[i] = best + 0.5 * (simplex[i] - best)
+                        scores[i] = self.evaluate(simplex[i])
+        best = int(np.argmin(scores))
+        return self.gains(simplex[best]), scores[best]
+
+    # print an evaluated candidate
+    def report(self, gains, score, cached):
+        if self.log is None:
+            return
+        gains = ", ".join(f"{name}={value:.4g}"
+                          for name, value in gains.items())
+        source = "cached" if cached else "simulated"
+        print(f"{self.evaluations:4d} {source:>9} score: {score:12.6g}  "
+              f"{gains}", file=self.log)
+
+    # stop the worker processes
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Tune the autopilot gains on the landing tests.")
+    parser.add_argument("--gains", nargs="+", metavar="NAME",
+                        choices=list(Autopilot.GAINS), default=None,
+                        help="gains to tune (default: all that the SAS modes "
+                        "of the landing tests read)")
+    parser.add_argument("--sas", metavar="MODE", default=None,
+                        help="SAS mode of the landing tests instead of 'land', "
+                        "e.g., 'land (heuristic)'")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="number of worker processes (default: all cores)")
+    parser.add_argument("-n", "--max-evaluations", type=int, default=100,
+                        help="largest number of evaluated candidates")
+    parser.add_argument("--cache", metavar="FILE", default=None,
+                        help="cache the evaluated candidates in a JSON file")
+    parser.add_argument("--json", metavar="FILE",
+                        help="write the tuned gains as JSON to FILE")
+    args = parser.parse_args()
+
+    try:
+        tuner = Autotuner(args.gains, args.sas, args.processes, args.cache)
+    except ValueError as error:
+        parser.error(str(error))
+    try:
+        gains, score = tuner.search(args.max_evaluations)
+    finally:
+        tuner.close()
+    print(f"best score: {score:.6g}, evaluations: {tuner.evaluations}, "
+          f"simulated: {tuner.simulations}")
+    print(json.dumps(gains, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(gains, f, indent=2)
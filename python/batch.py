@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+from multiprocessing import Pool
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+from game import RocketGame  # noqa: E402
+from tests import ALL_TESTS  # noqa: E402
+
+# maximum simulated time per scenario (in seconds)
+MAX_TIME = 600
+
+
+# run a single test scenario in its own headless game (and pymunk Space)
+# and return its results, settings override settings of the game, gains
+# override gains of the autopilot (see Autopilot.GAINS) and sas_mode (if
+# given) replaces the "land" SAS mode of the scenario
+def run_scenario(index, max_time=MAX_TIME, settings=None, sas_mode=None,
+                 gains=None):
+    wall_time = time.perf_counter()
+    # the settings are class attributes, so that they also apply to
+    # what the game sets up when it is created (e.g., the terrain)
+    game = type("RocketGame", (RocketGame,), dict(settings or {}))(
+        headless=True)
+    game.rocket.pilot.gains.update(gains or {})
+    # a copy of the test, so that the tests of this process (see
+    # RocketGame.run_tests) keep their settings, the test rebinds all of
+    # its state when it starts
+    test = copy.copy(ALL_TESTS[index])
+    test.verbose = False
+    test.next_test = None
+    test.start(game)
+    if sas_mode is not None and test.sas_mode == "land":
+        game.rocket.pilot.sas_mode = sas_mode
+    game.simulate(max_time, until=lambda game: game.test is None)
+    result = {"test": index, "finished": game.test is None}
+    result.update(test.results())
+    result["physics_steps"] = game.physics_steps
+    result["wall_time"] = time.perf_counter() - wall_time
+    return result
+
+
+# run all test scenarios in parallel on a process pool and return a report
+def run_all(processes=None, max_time=MAX_TIME, settings=None, sas_mode=None,
+            gains=None):
+    wall_time = time.perf_counter()
+    args = [(n, max_time, settings, sas_mode, gains)
+            for n in range(len(ALL_TESTS))]
+    with Pool(processes) as pool:
+        results = pool.starmap(run_scenario, args, chunksize=1)
+    return {
+        "scenarios": results,
+        "fuel_used": sum(r["fuel_used"] for r in results),
+        "time_taken": sum(r["time_taken"] for r in results),
+        "physics_steps": sum(r["physics_steps"] for r in results),
+        "failed": [r["test"] for r in results
+                   if not (r["finished"] and r["upright"])],
+        "wall_time": time.perf_counter() - wall_time,
+    }
+
+
+# print a report as a table
+def print_report(report, file=sys.stdout):
+    print(f"{'test':>4} {'finished':>8} {'upright':>7} {'fuel used':>12} "
+          f"{'time':>8} {'touchdown v':>11} {'steps':>7} {'wall time':>9}",
+          file=file)
+    for r in report["scenarios"]:
+        v = r["touchdown_velocity"]
+        v = "-" if v is None else f"{v:.2f}"
+        print(f"{r['test']:4d} {str(r['finished']):>8} "
+              f"{str(r['upright']):>7} {r['fuel_used']:12.4g} "
+              f"{r['time_taken']:8.2f} {v:>11} {r['physics_steps']:7d} "
+              f"{r['wall_time']:9.2f}", file=file)
+    print(f"total fuel used: {report['fuel_used']:.4g}, "
+          f"simulated time: {report['time_taken']:.2f}s, "
+          f"physics steps: {report['physics_steps']}, "
+          f"wall time: {report['wall_time']:.2f}s", file=file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run all landing tests in parallel headless games.")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="number of worker processes (default: all cores)")
+    parser.add_argument("--max-time", type=float, default=MAX_TIME,
+                        help="maximum simulated time per scenario in seconds")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="use adaptive physics time steps")
+    parser.add_argument("--sas", metavar="MODE", default=None,
+                        help="SAS mode of the landing tests instead of 'land', "
+                        "e.g., 'land (heuristic)'")
+    parser.add_argument("--terrain", metavar="HEIGHT", type=float, default=0,
+                        help="land on hills of up to HEIGHT (in m) instead of "
+                        "a flat ground")
+    parser.add_argument("--floating-origin", action="store_true",
+                        help="move the origin of the Space along with the "
+                        "rocket")
+    parser.add_argument("--json", metavar="FILE",
+                        help="also write the report as JSON to FILE ('-' for stdout)")
+    args = parser.parse_args()
+
+    settings = {}
+    if args.adaptive:
+        settings["ADAPTIVE_DT"] = True
+    if args.terrain:
+        settings["TERRAIN_AMPLITUDE"] = args.terrain
+    if args.floating_origin:
+        settings["FLOATING_ORIGIN"] = True
+    report = run_all(args.processes, args.max_time, settings, args.sas)
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        print_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import subprocess
+# rendering is benchmarked off-screen
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import pygame  # noqa: E402
+import pymunk  # noqa: E402
+from game import RocketGame  # noqa: E402
+from objects import Ball  # noqa: E402
+from tests import ALL_TESTS  # noqa: E402
+from batch import run_scenario  # noqa: E402
+
+# number of repetitions of each measurement, the best one is reported
+REPEAT = 5
+# numbers of obstacles for the physics and rendering benchmarks
+BALL_COUNTS = [0, 100, 1000]
+
+
+# the best time per call of func (in seconds) out of a number of repetitions,
+# setup is called (untimed) before each repetition
+def timed(func, number, repeat=REPEAT, setup=None):
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - t) / number)
+    return best
+
+
+# a game with n obstacles at reproducible random positions around the rocket
+def make_game(n_balls=0, headless=True):
+    game = RocketGame(headless=headless, seed=0)
+    rng = random.Random(0)
+    for _ in range(n_balls):
+        x, y = rng.uniform(-700, 700), rng.uniform(50, 900)
+        game.add_object(Ball(game.space, x, y))
+    return game
+
+
+# physics steps per second of RocketGame.update_physics
+def bench_physics(n_balls, steps=200, repeat=REPEAT):
+    game = make_game(n_balls)
+    game.rocket.engine.ignited = True
+    state = game.snapshot()
+    return 1 / timed(game.update_physics, steps, repeat,
+                     setup=lambda: game.restore(state))
+
+
+# physics steps per second of RocketGame.update_frame_physics for a field of
+# balls resting on the ground left and right of the rocket, with or without
+# the large scene mode (where the balls fall asleep)
+def bench_obstacle_field(n_balls, large_scene, frames=20, repeat=REPEAT):
+    game = RocketGame(headless=True, seed=0)
+    for i in range(n_balls):
+        x = (i // 2 + 2) * 25 * (1 if i % 2 else -1)
+        game.add_object(Ball(game.space, x, 16))
+    if large_scene:
+        game.use_large_scene()
+    game.simulate(1)  # let the balls settle
+    return game.physics_steps_per_frame() / timed(
+        game.update_frame_physics, frames, repeat)
+
+
+# calls per second of Autopilot.auto_controls in a SAS mode, for a rocket
+# that flies on (untimed) between the calls, so that the autopilot sees a
+# changing state and plans at its actual rate in the "land" mode (the
+# default number of calls covers a landing from the start state)
+def bench_autopilot(sas_mode, calls=300, repeat=REPEAT):
+    game = make_game()
+    rocket = game.rocket
+    rocket.set_body_state((0, 5000), (100, -300), 0.3, 0.5)
+    rocket.engine.ignited = True
+    rocket.pilot.sas_mode = sas_mode
+    state = game.snapshot()
+    best = float("inf")
+    for _ in range(repeat):
+        game.restore(state)
+        total = 0
+        for _ in range(calls):
+            t = time.perf_counter()
+            rocket.pilot.auto_controls(game)
+            total += time.perf_counter() - t
+            game.update_frame_physics()
+        best = min(best, total / calls)
+    return 1 / best
+
+
+# wall time (in seconds) of all landing test scenarios, run one after another
+def bench_landing_tests():
+    wall_time = time.perf_counter()
+    steps = 0
+    for n in range(len(ALL_TESTS)):
+        steps += run_scenario(n)["physics_steps"]
+    return time.perf_counter() - wall_time, steps
+
+
+# time per frame (in seconds) of RocketGame.draw, with the engine firing
+def bench_draw(n_balls, frames=50, repeat=REPEAT):
+    pygame.init()
+    game = make_game(n_balls, headless=False)
+    game.rocket.engine.ignited = True
+    game.rocket.pilot.show_trajectory = True
+    game.draw()  # load the graphics
+    return timed(game.draw, frames, repeat)
+
+
+# run all benchmarks and return the results as a dict
+# {name: {"value": value, "unit": unit}}
+def run_benchmarks(repeat=REPEAT, log=sys.stderr):
+    results = {}
+
+    def add(name, value, unit):
+        results[name] = {"value": value, "unit": unit}
+        print(f"{name:<36} {value:12.4g} {unit}", file=log)
+
+    for n in BALL_COUNTS:
+        add(f"physics[balls={n}]", bench_physics(n, repeat=repeat), "steps/s")
+    for large_scene in [False, True]:
+        add(f"obstacle_field[balls={BALL_COUNTS[-1]},large={large_scene:d}]",
+            bench_obstacle_field(BALL_COUNTS[-1], large_scene, repeat=repeat),
+            "steps/s")
+    for mode in ["OFF", "assist", "stabilize", "hover", "land",
+                 "land (heuristic)"]:
+        add(f"autopilot[sas={mode}]", bench_autopilot(mode, repeat=repeat),
+            "calls/s")
+    wall_time, steps = bench_landing_tests()
+    add("landing_tests.wall_time", wall_time, "s")
+    add("landing_tests.steps_per_s", steps / wall_time, "steps/s")
+    for n in BALL_COUNTS:
+        add(f"draw[balls={n}]", bench_draw(n, repeat=repeat) * 1e3, "ms/frame")
+    return results
+
+
+# the environment of a benchmark run
+def metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or None,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "pymunk": pymunk.version,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "system": platform.platform(),
+    }
+
+
+# print the change of each result relative to a previous run
+def print_comparison(results, previous, file=sys.stdout):
+    print(f"{'benchmark':<36} {'before':>12} {'after':>12} {'change':>8}",
+          file=file)
+    for name, result in results.items():
+        if name not in previous:
+            continue
+        before, after = previous[name]["value"], result["value"]
+        change = after / before - 1 if before else float("nan")
+        print(f"{name:<36} {before:12.4g} {after:12.4g} {change:+8.1%} "
+              f"{result['unit']}", file=file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the physics, autopilot and rendering.")
+    parser.add_argument("--repeat", type=int, default=REPEAT,
+                        help="repetitions per measurement (the best counts)")
+    parser.add_argument("--json", metavar="FILE",
+                        help="write the results as JSON to FILE ('-' for stdout)")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="compare with the JSON results of a previous run")
+    args = parser.parse_args()
+
+    for test in ALL_TESTS:
+        test.verbose = False
+    report = {"meta": metadata(), "results": run_benchmarks(args.repeat)}
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+        print_comparison(report["results"], previous)
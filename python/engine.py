@@ -1,7 +1,52 @@
 import math
+from collections import OrderedDict
 import pygame
 
 
+class SpriteCache():
+    """
+    Least-recently-used cache of rotated and scaled sprites.
+    Angles and scales are quantized into buckets, so that the (expensive)
+    rendering function render(angle, scale) only runs when a new bucket
+    is needed. The cache can be disabled and counts its hits and misses.
+    """
+
+    def __init__(self, render, angle_step=2, scale_step=0.02, max_size=256):
+        self.render = render
+        self.angle_step = angle_step  # in degrees
+        self.scale_step = scale_step  # relative
+        self.max_size = max_size
+        self.enabled = True
+        self.sprites = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # get the sprite for an angle (in degrees) and a scale
+    def get(self, angle, scale):
+        if not self.enabled:
+            self.misses += 1
+            return self.render(angle, scale)
+        n_angle = round(angle / self.angle_step) % round(360 / self.angle_step)
+        n_scale = round(math.log(scale) / math.log1p(self.scale_step))
+        key = n_angle, n_scale
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.hits += 1
+            self.sprites.move_to_end(key)
+            return sprite
+        self.misses += 1
+        sprite = self.render(n_angle * self.angle_step,
+                             (1 + self.scale_step) ** n_scale)
+        self.sprites[key] = sprite
+        if len(self.sprites) > self.max_size:
+            self.sprites.popitem(last=False)
+        return sprite
+
+    # remove all sprites from the cache
+    def clear(self):
+        self.sprites.clear()
+
+
 class Engine():
 
     def __init__(self):
@@ -12,16 +57,19 @@ class Engine():
         self.MIN_THRUST = 3.6e7
         self.MAX_THRUST_CHANGE = 1e7
         self.thrust = self.MAX_THRUST
-        # amout of fuel consumed per thrust generated
-        self.FUEL_CONSUMPTION = 1
+        # mass of fuel consumed per impulse generated (thrust * time),
+        # in kg/(N*s)
+        self.FUEL_CONSUMPTION = 1e-5
 
         # the angle of the thrust vector
         self.angle = 0
         self.MAX_ANGLE = math.pi / 4
         self.MAX_ANGLE_CHANGE = 1e9
 
-        # graphics
-        self.flame_img = pygame.image.load('public/res/flame.png').convert_alpha()
+        # graphics (loaded on the first draw, so that headless games need no display)
+        # and a cache of the rotated and scaled flame sprites
+        self.flame_img = None
+        self.flame_sprites = SpriteCache(self.render_flame)
 
     def set_thrust(self, thrust):
         thrust = min(thrust, self.thrust + self.MAX_THRUST_CHANGE)
@@ -46,6 +94,14 @@ class Engine():
     def ignite(self):
         self.ignited = True
 
+    # get the state of the engine (see set_state)
+    def get_state(self):
+        return self.ignited, self.thrust, self.angle
+
+    # restore a state captured with get_state
+    def set_state(self, state):
+        self.ignited, self.thrust, self.angle = state
+
     def cut_off(self):
         self.ignited = False
 
@@ -59,11 +115,17 @@ class Engine():
         #     pymunk.Vec2d(math.sin(angle), -math.cos(angle))
         # p2 = game.pos2screen(thrust_end)
         # pygame.draw.lines(game.screen, pygame.Color("red"), False, [p1, p2], 2)
-        w, h = self.flame_img.get_size()
-        aux_img = pygame.Surface((w*2, h*2), pygame.SRCALPHA)
-        aux_img.blit(self.flame_img, (w/2, h))
-        aux_img = pygame.transform.rotozoom(
-            aux_img, angle*180/math.pi, 0.01*ll)
+        aux_img = self.flame_sprites.get(angle*180/math.pi, 0.01*ll)
         aux_rect = aux_img.get_rect()
         aux_rect.centerx, aux_rect.centery = p1
         game.screen.blit(aux_img, aux_rect)
+
+    # render the flame sprite, rotated and scaled around the nozzle
+    def render_flame(self, angle, scale):
+        if self.flame_img is None:
+            flame_img = pygame.image.load(
+                'public/res/flame.png').convert_alpha()
+            w, h = flame_img.get_size()
+            self.flame_img = pygame.Surface((w*2, h*2), pygame.SRCALPHA)
+            self.flame_img.blit(flame_img, (w/2, h))
+        return pygame.transform.rotozoom(self.flame_img, angle, scale)
@@ -0,0 +1,307 @@
+#!/usr/bin/python3
+
+import os
+import time
+import argparse
+import numpy as np
+import pymunk.batch
+from pymunk.batch import BodyFields
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+from game import RocketGame  # noqa: E402
+from rocket import Rocket  # noqa: E402
+from objects import Ball  # noqa: E402
+from vectorized import RocketBatch  # noqa: E402
+
+
+class Fleet(RocketBatch):
+    """
+    Many autopilot-controlled rockets in the pymunk Space of a game, where
+    they collide with each other and with all other objects. Instead of
+    Autopilot.auto_controls, Rocket.update_drag and Rocket.update_forces per
+    rocket, the controls and forces of all rockets are computed at once,
+    with the control laws and force model of RocketBatch. At every physics
+    step, the state of all bodies is read from the Space with one call of
+    pymunk.batch, and the forces and torques are written back with another.
+    The Rocket objects keep the fuel tanks and mass properties, which are
+    updated once per frame (with the fuel burned during the frame), and
+    their engines are updated from the controls for drawing.
+    Fleets are not part of game snapshots.
+    """
+
+    # in a game, the "land" SAS mode flies the landing planner, which is
+    # not vectorized, so it is not replaced by the heuristic control law
+    SAS_ALIASES = {}
+
+    # the body data read from and written to the Space, the columns of
+    # the read data are: position (2), angle, velocity (2), angular
+    # velocity, force (2) and torque
+    READ_FIELDS = BodyFields.BODY_ID | BodyFields.POSITION | \
+        BodyFields.ANGLE | BodyFields.VELOCITY | \
+        BodyFields.ANGULAR_VELOCITY | BodyFields.FORCE | BodyFields.TORQUE
+    WRITE_FIELDS = BodyFields.ANGULAR_VELOCITY | BodyFields.FORCE | \
+        BodyFields.TORQUE
+    COLUMNS = 9
+
+    def __init__(self, game, n, w=15, h=150, mass=300e3, gains=None):
+        super().__init__(n, w, h, mass, gains)
+        self.game = game
+        self.GRAVITY = game.GRAVITY
+        self.DT = game.DT
+        self.FPS = game.FPS
+        self.GROUND_HEIGHT = game.GROUND_HEIGHT
+        atmosphere = game.atmosphere
+        self.winds = None
+        if atmosphere.wind_speed:
+            self.winds = np.array(atmosphere.winds)
+
+        # the rockets, added to the game without the physics hooks
+        self.rockets = []
+        for _ in range(n):
+            rocket = Rocket(game.space, 0, 100, w, h, mass)
+            rocket.random.seed(game.random.getrandbits(32))
+            rocket.pilot.gains.update(self.gains)
+            game.add_object(rocket, hooks=False)
+            self.rockets.append(rocket)
+        self.body_ids = [rocket.body.id for rocket in self.rockets]
+        # the rows of the rockets in the body data of the Space, which are
+        # looked up again when the bodies of the Space change
+        self.space_ids = None
+        self.rows = None
+        self.buffer = pymunk.batch.Buffer()
+        # fuel burned by each rocket since the rockets were last updated
+        self.burned = np.zeros(n)
+        self.update_mass_properties()
+
+    # set the start state of the rockets (see RocketBatch.start)
+    def start(self, position, velocity=(0, 0), angle=0, angular_velocity=0,
+              sas_mode="land (heuristic)"):
+        super().start(position, velocity, angle, angular_velocity, sas_mode)
+        for rocket, p, v, a, w in zip(
+                self.rockets, self.position.tolist(), self.velocity.tolist(),
+                self.angle.tolist(), self.angular_velocity.tolist()):
+            rocket.set_body_state(self.game.to_space(p), v, a, w)
+        self.update_rockets()
+
+    # the height of the ground of the game below each rocket, in world
+    # coordinates (as the state of the rockets)
+    def ground_height(self, x):
+        terrain = self.game.terrain
+        return np.array([terrain.world_height(x) for x in x.tolist()])
+
+    # read the data of all bodies in the Space (a copy, with a row per body)
+    def read_bodies(self):
+        buffer = self.buffer
+        buffer.clear()
+        pymunk.batch.get_space_bodies(self.game.space, self.READ_FIELDS,
+                                      buffer)
+        ids = np.frombuffer(buffer.int_buf(), dtype=np.int64)
+        if self.space_ids is None or not np.array_equal(ids, self.space_ids):
+            self.space_ids = ids.copy()
+            row = {body_id: i for i, body_id in enumerate(ids.tolist())}
+            self.rows = np.array([row[body_id] for body_id in self.body_ids])
+        return np.frombuffer(buffer.float_buf()).reshape(
+            len(ids), self.COLUMNS).copy()
+
+    # load the state of the rockets from their rows of the body data (in
+    # world coordinates, which the control laws and force model assume)
+    def load_state(self, data):
+        self.angle = data[:, 2].copy()
+        self.velocity = data[:, 3:5].copy()
+        self.angular_velocity = data[:, 5].copy()
+        self.center = data[:, 0:2] + self.cog_offset() + \
+            tuple(self.game.origin)
+
+    # apply the drag and thrust of all rockets for a physics step dt
+    # (instead of Rocket.update_drag and Rocket.update_forces)
+    def update_physics(self, dt):
+        data = self.read_bodies()
+        rows = self.rows
+        self.load_state(data[rows])
+        cos, sin = np.cos(self.angle), np.sin(self.angle)
+        fx, fy, torque = self.drag_forces(cos, sin)
+        thrust, burned = self.burn_fuel(dt)
+        self.burned += burned
+        thrust_x, thrust_y, thrust_torque = self.thrust_forces(
+            thrust, cos, sin)
+        # relax angular velocity (by 0.1% per millisecond)
+        data[rows, 5] *= 0.999 ** (dt / 1e-3)
+        data[rows, 6] += fx + thrust_x
+        data[rows, 7] += fy + thrust_y
+        data[rows, 8] += torque + thrust_torque
+        self.write_bodies(data)
+        self.time += dt
+
+    # write the angular velocities, forces and torques back to the Space
+    def write_bodies(self, data):
+        if self.game.large_scene:
+            # pymunk.batch would wake up all sleeping bodies of a large
+            # scene, so only the rockets are written, one by one
+            for rocket, (w, fx, fy, torque) in zip(
+                    self.rockets, data[self.rows, 5:].tolist()):
+                body = rocket.body
+                body.angular_velocity = w
+                body.force = fx, fy
+                body.torque = torque
+            return
+        # the forces of the other bodies are written back unchanged
+        buffer = pymunk.batch.Buffer()
+        buffer.set_float_buf(np.ascontiguousarray(data[:, 5:]).ravel())
+        pymunk.batch.set_space_bodies(self.game.space, self.WRITE_FIELDS,
+                                      buffer)
+
+    # the controls of all rockets, once per frame (instead of
+    # Autopilot.auto_controls)
+    def auto_controls(self):
+        self.update_mass_properties()
+        self.load_state(self.read_bodies()[self.rows])
+        super().auto_controls()
+        self.update_rockets()
+
+    # drain the fuel burned since the last update from the rockets' tanks
+    # and get their mass properties
+    def update_mass_properties(self):
+        for i in np.flatnonzero(self.burned):
+            rocket = self.rockets[i]
+            burned = float(self.burned[i])
+            rocket.consume_fuel(burned)
+            rocket.stats["fuel_used"] += burned
+        self.burned[:] = 0
+        bodies = [rocket.body for rocket in self.rockets]
+        self.mass = np.array([body.mass for body in bodies])
+        self.moment = np.array([body.moment for body in bodies])
+        self.cog_y = np.array([body.center_of_gravity.y for body in bodies])
+
+    # set the engines, airbrakes and SAS modes of the rockets from the
+    # controls (e.g., for drawing)
+    def update_rockets(self):
+        for rocket, thrust, angle, ignited, airbrakes, sas_mode in zip(
+                self.rockets, self.thrust.tolist(),
+                self.engine_angle.tolist(), self.ignited.tolist(),
+                self.airbrakes_enabled.tolist(), self.sas_mode.tolist()):
+            engine = rocket.engine
+            engine.thrust = thrust
+            engine.angle = angle
+            engine.ignited = ignited
+            rocket.airbrakes_enabled = airbrakes
+            rocket.pilot.sas_mode = self.SAS_MODES[sas_mode]
+
+
+class FleetGame(RocketGame):
+    """
+    A RocketGame with fleets of rockets (see Fleet), besides its own rocket,
+    which the camera and the HUD follow.
+    """
+
+    def __init__(self, headless=False, seed=None):
+        super().__init__(headless, seed)
+        self.fleets = []
+
+    # add a fleet of n rockets to the game and return it
+    def add_fleet(self, n, **kwargs):
+        fleet = Fleet(self, n, **kwargs)
+        self.fleets.append(fleet)
+        return fleet
+
+    # apply the forces of the fleets before the physics step
+    def update_physics(self, dt=None):
+        if dt is None:
+            dt = self.DT
+        if self.run_physics:
+            with self.profiler.section("physics.fleet"):
+                for fleet in self.fleets:
+                    fleet.update_physics(dt)
+        super().update_physics(dt)
+
+    # the controls of the game, then those of the fleets
+    def handle_controls(self, events=None, pressed_keys=None):
+        super().handle_controls(events, pressed_keys)
+        with self.profiler.section("autopilot.fleet"):
+            for fleet in self.fleets:
+                fleet.auto_controls()
+
+
+# sample start states of n rockets side by side, spacing apart (in m),
+# returns (position, velocity, angle, angular_velocity)
+def sample_start(n, rng=None, spacing=45, height=(1e3, 5e3),
+                 velocity_x=(-50, 50), angle=(-0.3, 0.3)):
+    rng = np.random.default_rng(rng)
+    position = np.zeros((n, 2))
+    position[:, 0] = (np.arange(n) - (n - 1) / 2) * spacing
+    position[:, 1] = rng.uniform(*height, n)
+    velocity = np.zeros((n, 2))
+    velocity[:, 0] = rng.uniform(*velocity_x, n)
+    return position, velocity, rng.uniform(*angle, n), np.zeros(n)
+
+
+# simulate n rockets landing in one Space (with some balls in between)
+# and measure the throughput, with batched=False, each rocket applies its
+# own controls and forces
+def run(n, duration, batched=True, balls=0, seed=0,
+        sas_mode="land (heuristic)"):
+    game = FleetGame(headless=True, seed=seed)
+    position, velocity, angle, angular_velocity = sample_start(n, seed)
+    if batched:
+        fleet = game.add_fleet(n)
+        fleet.start(position, velocity, angle, angular_velocity, sas_mode)
+        rockets = fleet.rockets
+    else:
+        rockets = []
+        for p, v, a, w in zip(position.tolist(), velocity.tolist(),
+                              angle.tolist(), angular_velocity.tolist()):
+            rocket = game.add_object(Rocket(game.space, *p))
+            rocket.set_body_state(p, v, a, w)
+            rocket.engine.ignited = True
+            rocket.pilot.sas_mode = sas_mode
+            rockets.append(rocket)
+    rng = np.random.default_rng(seed)
+    width = max(n - 1, 1) * 45
+    for x, y in zip(rng.uniform(-width / 2, width / 2, balls),
+                    rng.uniform(100, 5000, balls)):
+        game.add_object(Ball(game.space, x, y))
+
+    wall_time = time.perf_counter()
+    steps = game.physics_steps
+    while game.time < duration:
+        game.handle_controls()
+        if not batched:
+            for rocket in rockets:
+                rocket.handle_controls(game)
+        game.update_frame_physics()
+    wall_time = time.perf_counter() - wall_time
+    steps = game.physics_steps - steps
+    return {
+        "rockets": n,
+        "balls": balls,
+        "batched": batched,
+        "physics_steps": steps,
+        "wall_time": wall_time,
+        "rocket_steps_per_s": n * steps / wall_time,
+        "landed": sum(rocket.pilot.sas_mode == "OFF" for rocket in rockets),
+        "fuel_used": sum(rocket.stats["fuel_used"] for rocket in rockets),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Land a fleet of rockets in one Space and measure the "
+        "throughput in rocket-steps per second.")
+    parser.add_argument("-n", "--rockets", type=int, nargs="+", default=[100],
+                        help="fleet sizes (default: 100)")
+    parser.add_argument("--time", type=float, default=5,
+                        help="simulated time in seconds (default: 5)")
+    parser.add_argument("--balls", type=int, default=0,
+                        help="number of ball obstacles between the rockets")
+    parser.add_argument("--unbatched", action="store_true",
+                        help="also run each rocket on its own, to compare")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    modes = [True, False] if args.unbatched else [True]
+    for n in args.rockets:
+        for batched in modes:
+            r = run(n, args.time, batched, args.balls, args.seed)
+            print(f"rockets: {n:5d} ({'batched' if batched else 'single'}), "
+                  f"steps: {r['physics_steps']}, "
+                  f"wall time: {r['wall_time']:.2f}s, "
+                  f"rocket-steps/s: {r['rocket_steps_per_s']:.4g}, "
+                  f"landed: {r['landed']}/{n}")
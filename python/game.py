@@ -1,11 +1,41 @@
 
 import math
+import random
+import statistics
+from collections import namedtuple
 import pygame
 import pymunk
 from pymunk import Vec2d
-from objects import Wall, Ball, Rectangle
+from objects import Ball, Rectangle
 from rocket import Rocket
 from tests import ALL_TESTS
+from hud import Hud
+from registry import ObjectRegistry
+from profiler import Profiler
+from atmosphere import Atmosphere
+from terrain import Terrain
+from ground import Ground
+
+
+class KeyState():
+    """
+    Stand-in for pygame.key.get_pressed() that works without a display.
+    Holds the set of currently pressed keys.
+    """
+
+    def __init__(self, keys=()):
+        self.keys = frozenset(keys)
+
+    def __getitem__(self, key):
+        return key in self.keys
+
+
+# a snapshot of the simulation state of a RocketGame (see RocketGame.snapshot),
+# objects is a tuple of (object, object state) pairs
+GameState = namedtuple("GameState", [
+    "time", "frame", "physics_steps", "run_physics", "adaptive_dt",
+    "accelerations", "random", "rocket", "objects", "test", "test_state",
+    "origin", "rebases"])
 
 
 class RocketGame():
@@ -14,64 +44,242 @@ class RocketGame():
     FRAME_WIDTH = 1600  # in px
     FRAME_HEIGHT = 900  # in px
     GRAVITY = 600
-    DRAG = 1
+    DRAG = 1  # scale of the drag of passive objects
+    WIND = 0  # wind speed at Atmosphere.WIND_HEIGHT, in m/s
+    # the ground (see terrain.Terrain): flat at GROUND_HEIGHT, with hills of
+    # up to TERRAIN_AMPLITUDE (0 for a flat ground) around the LANDING_PADS
+    GROUND_HEIGHT = 6  # in m
+    TERRAIN_AMPLITUDE = 0  # in m
+    TERRAIN_SEED = 0
+    LANDING_PADS = ((0, 300),)  # (center, width), in m
     DT = 1. / 1000.  # in seconds
     FPS = 50
+    # adaptive time stepping: large steps in free flight, DT near contacts
+    ADAPTIVE_DT = False
+    MAX_DT = 1. / 50.  # largest adaptive time step, in seconds
+    DT_TOLERANCE = 1e-2  # tolerated velocity error per step, in m/s
+    MAX_ANGLE_STEP = 1e-2  # largest rotation per step, in rad
+    CONTACT_MARGIN = 1  # distance at which shapes count as near contact, in m
     SAVE_IMG = False
+    VIEW_MARGIN = 200  # margin around the screen for culling objects, in m
+    # large scene mode for many obstacles: collision detection with a spatial
+    # hash, sleeping of resting bodies and despawning of far objects
+    LARGE_SCENE = False
+    SLEEP_TIME = 0.5  # time at rest after which bodies fall asleep, in s
+    IDLE_SPEED = 0  # speed of bodies at rest (0: GRAVITY * DT), in m/s
+    HASH_CELL_SIZE = 2  # size of the hash cells per median shape size
+    HASH_CELLS = 10  # number of hash cells per shape
+    DESPAWN_DISTANCE = 2e4  # distance from the region of interest, in m
+    DESPAWN_INTERVAL = 50  # frames between checks for far objects
+    # floating origin for long-range flights: the origin of the Space moves
+    # to the rocket when it gets farther than REBASE_DISTANCE from it, so
+    # that the coordinates in the Space stay small and precise
+    FLOATING_ORIGIN = False
+    REBASE_DISTANCE = 1e4  # in m
     # ZOOM = 1  # in px / meter
 
-    def __init__(self):
+    def __init__(self, headless=False, seed=None):
 
         # screen and runtime
-        self.screen = pygame.display.set_mode(
-            (self.FRAME_WIDTH, self.FRAME_HEIGHT), pygame.RESIZABLE)
+        # a headless game has no window, loads no graphics and is never drawn
+        self.headless = headless
+        self.screen = None
+        if not headless:
+            self.screen = pygame.display.set_mode(
+                (self.FRAME_WIDTH, self.FRAME_HEIGHT), pygame.RESIZABLE)
         self.clock = pygame.time.Clock()
+        self.hud = Hud()
+        # timing of the sections of the game loop (disabled by default)
+        self.profiler = Profiler()
         self.time = 0
+        self.frame = 0
+        self.physics_steps = 0
+
+        # random number generator, seeded for reproducible runs
+        if seed is None:
+            seed = random.randrange(2**32)
+        self.seed = seed
+        self.random = random.Random(seed)
+
+        # state of the adaptive time stepping: the next step size and
+        # the accelerations of the dynamic bodies in the last step
+        self.adaptive_dt = self.DT
+        self.accelerations = {}
 
         # game state variables
         self.running = True
         self.run_physics = True
+        # the (position, angle) at which bodies are drawn instead of their
+        # own, e.g., interpolated by a physics_thread.PhysicsThread
+        # (None to draw all bodies as they are)
+        self.draw_poses = None
 
         # physics stuff
         self.space = pymunk.Space()
         self.space.gravity = 0.0, -self.GRAVITY
+        # world position of the origin of the Space (moved with the floating
+        # origin) and the number of times the floating origin moved it
+        self.origin = Vec2d(0, 0)
+        self.rebases = 0
+        # the air density and wind over the height
+        self.atmosphere = Atmosphere(wind=self.WIND)
+        # the height of the ground, built in chunks as the rocket moves
+        self.terrain = Terrain(self.GROUND_HEIGHT, self.TERRAIN_AMPLITUDE,
+                               self.LANDING_PADS, self.TERRAIN_SEED)
+        self.ground = Ground(self.terrain)
 
         # game objects
-        self.objects = []
+        self.objects = ObjectRegistry(self.space)
         self.rocket = None
 
         # list of events and pressed keys
         self.events = []
-        self.pressed_keys = []
+        self.pressed_keys = KeyState()
+        # optional hook to record or play back the input
+        # (e.g., a replay.ReplayRecorder or replay.ReplayPlayer)
+        self.replay = None
+
+        # state of the large scene mode: the number of objects the spatial
+        # hash was tuned for, the speed of bodies at rest (0 if the mode is
+        # off) and the number of objects that were despawned
+        self.large_scene = False
+        self.hashed_objects = 0
+        self.rest_speed = 0
+        self.despawned = 0
 
-        # add ground
-        for n in range(4):
-            self.add_object(
-                Wall(self.space, Vec2d(-1e9, 2*n), Vec2d(1e9, 2*n)))
-        # add the rocket
+        # add the rocket and the ground around it
         self.add_new_rocket()
+        self.ground.update(self)
+        if self.LARGE_SCENE:
+            self.use_large_scene()
 
         # storage for a unit test, if performing a test
         self.test = None
 
-    # add an object to the game and return it
-    def add_object(self, obj):
-        if obj not in self.objects:
-            self.objects.append(obj)
-        return obj
+        # optional recorder of the telemetry at every physics step
+        # (e.g., a telemetry.TelemetryRecorder)
+        self.recorder = None
+
+    # add an object to the game and return it, without hooks, the physics
+    # does not apply its forces and drag (see ObjectRegistry.add)
+    def add_object(self, obj, hooks=True):
+        obj.atmosphere = self.atmosphere
+        obj.terrain = self.terrain
+        return self.objects.add(obj, hooks)
 
-    # remove an object from the game
+    # remove an object from the game (and its body and shape from the space)
     def remove_object(self, obj):
-        if obj in self.objects:
-            self.objects.remove(obj)
+        self.objects.remove(obj)
+
+    # switch to the large scene mode: the collision detection uses a spatial
+    # hash instead of a bounding box tree, resting bodies fall asleep and
+    # objects far from the region of interest are removed.
+    # Bodies that sleep stay asleep when the physics does not touch them,
+    # but a restored snapshot wakes up all bodies.
+    def use_large_scene(self):
+        self.large_scene = True
+        self.space.sleep_time_threshold = self.SLEEP_TIME
+        self.space.idle_speed_threshold = self.IDLE_SPEED
+        self.rest_speed = self.IDLE_SPEED or self.GRAVITY * self.DT
+        self.tune_spatial_hash()
+
+    # the center of the region of interest (where the rocket is)
+    def region_of_interest(self):
+        if self.rocket is None:
+            return Vec2d(0, 0)
+        return self.rocket.body.position
+
+    # the height of the ground at x
+    def ground_height(self, x):
+        return self.terrain.height(x)
+
+    # transform coordinates in the Space to world coordinates
+    def to_world(self, pos):
+        return Vec2d(*pos) + self.origin
+
+    # transform world coordinates to coordinates in the Space
+    def to_space(self, pos):
+        return Vec2d(*pos) - self.origin
+
+    # move the origin of the Space to a world position: all bodies move
+    # along, so that their world positions stay the same, and the objects,
+    # the atmosphere and the terrain follow the new origin
+    def move_origin(self, origin):
+        origin = Vec2d(*origin)
+        offset = origin - self.origin
+        if offset == (0, 0):
+            return
+        self.origin = origin
+        self.atmosphere.origin = origin.y
+        self.terrain.origin = tuple(origin)
+        space = self.space
+        for body in list(space.bodies) + [space.static_body]:
+            body.position -= offset
+        space.reindex_static()
+        for obj in self.objects:
+            obj.shift_origin(offset)
+
+    # once per frame with the floating origin: move the origin to the
+    # region of interest (rounded to whole meters) when it is far from it
+    def update_origin(self):
+        x, y = self.region_of_interest()
+        limit = self.REBASE_DISTANCE
+        if abs(x) > limit or abs(y) > limit:
+            self.move_origin(self.origin + (round(x), round(y)))
+            self.rebases += 1
+
+    # set up the spatial hash for the current objects: the cells are a few
+    # times the median size of the shapes of the dynamic bodies, and there
+    # are a few times more cells than shapes (see HASH_CELL_SIZE, HASH_CELLS)
+    def tune_spatial_hash(self):
+        sizes = []
+        for obj in self.objects:
+            if obj.body.body_type != pymunk.Body.DYNAMIC:
+                continue
+            for shape in obj.shapes:
+                bb = shape.bb
+                sizes.append(max(bb.right - bb.left, bb.top - bb.bottom))
+        size = statistics.median(sizes) if sizes else 20
+        n_shapes = len(self.space.shapes)
+        self.space.use_spatial_hash(self.HASH_CELL_SIZE * size,
+                                    max(self.HASH_CELLS * n_shapes, 1000))
+        self.hashed_objects = len(self.objects)
+
+    # once per frame in the large scene mode: retune the spatial hash when
+    # the number of objects changed a lot and remove far objects
+    def update_large_scene(self):
+        n = len(self.objects)
+        if n > 2 * self.hashed_objects or 4 * n < self.hashed_objects:
+            self.tune_spatial_hash()
+        x, y = self.region_of_interest()
+        if self.frame % self.DESPAWN_INTERVAL == 0:
+            self.despawn_far_objects(x, y)
+
+    # remove the dynamic objects (except rockets) that are farther than
+    # DESPAWN_DISTANCE from (x, y)
+    def despawn_far_objects(self, x, y):
+        limit = self.DESPAWN_DISTANCE ** 2
+        far = []
+        for body, obj in self.objects.body_objects.items():
+            if body.body_type != pymunk.Body.DYNAMIC or \
+                    isinstance(obj, Rocket):
+                continue
+            px, py = body.position
+            if (px - x) ** 2 + (py - y) ** 2 > limit:
+                far.append(obj)
+        for obj in far:
+            self.remove_object(obj)
+        self.despawned += len(far)
 
     # add a new rocket
     def add_new_rocket(self):
         # remove the previous rocket
         if self.rocket is not None:
             self.remove_object(self.rocket)
-        # create new rocket
-        self.rocket = Rocket(self.space, 0, 100)
+        # create new rocket (at the same world position, wherever the
+        # origin of the Space is)
+        self.rocket = Rocket(self.space, *self.to_space((0, 100)))
+        self.rocket.random.seed(self.random.getrandbits(32))
         # add it to the game
         self.add_object(self.rocket)
 
@@ -89,122 +297,343 @@ class RocketGame():
         # constraint = pymunk.PinJoint(self.rocket.body, rect.body, (-20, 0), (0, 0))
         # self.space.add(constraint)
 
-    # update the physics of the game and each object
-    def update_physics(self):
+    # capture the state of the simulation: time, objects (with their bodies,
+    # engine, pilot and statistics), random numbers and the running test.
+    # The snapshot refers to the game objects and only stores their state
+    # as immutable data, so it is cheap to take and can be restored any
+    # number of times, e.g., to branch several simulations from one moment.
+    def snapshot(self):
+        test_state = None
+        if self.test is not None:
+            test_state = self.test.get_state()
+        return GameState(
+            self.time, self.frame, self.physics_steps, self.run_physics,
+            self.adaptive_dt, dict(self.accelerations), self.random.getstate(),
+            self.rocket, tuple((obj, obj.get_state()) for obj in self.objects),
+            self.test, test_state, self.origin, self.rebases)
+
+    # restore a snapshot of this game in place: objects added since the
+    # snapshot are removed, removed objects are added again and all objects
+    # get their state back. The pymunk Space is kept, but its cached contacts
+    # are not part of the snapshot, so bodies in contact may deviate slightly.
+    def restore(self, state):
+        self.time = state.time
+        self.frame = state.frame
+        self.physics_steps = state.physics_steps
+        self.run_physics = state.run_physics
+        self.adaptive_dt = state.adaptive_dt
+        self.accelerations = dict(state.accelerations)
+        self.random.setstate(state.random)
+        # the origin first, the states of the objects are relative to it
+        self.move_origin(state.origin)
+        self.rebases = state.rebases
+        # objects
+        objects = dict(state.objects)
+        for obj in list(self.objects):
+            if obj not in objects:
+                self.remove_object(obj)
+        for obj, obj_state in state.objects:
+            self.add_object(obj)
+            obj.set_state(obj_state)
+        self.rocket = state.rocket
+        # test
+        self.test = state.test
+        if self.test is not None:
+            self.test.game = self
+            self.test.set_state(state.test_state)
+
+    # update the physics of the game and each object by a time step dt
+    def update_physics(self, dt=None):
+        if dt is None:
+            dt = self.DT
         if self.run_physics:
-            # update the external forces for each object
-            for obj in self.objects:
-                obj.update_drag()
-                obj.update_forces()
+            # update the external forces of the objects that implement them
+            # (the drag of passive objects is applied once per frame)
+            profiler = self.profiler
+            with profiler.section("physics.drag"):
+                for obj in self.objects.dragged:
+                    obj.update_drag(dt)
+            with profiler.section("physics.forces"):
+                for obj in self.objects.forced:
+                    obj.update_forces(dt)
             # perform time steps
-            self.space.step(self.DT)
+            with profiler.section("physics.step"):
+                self.space.step(dt)
             # update time
-            self.time += self.DT
-
-    # process the controls of the game (events, pressed keys, etc.)
-    def handle_controls(self):
-
-        self.events = pygame.event.get()
-        self.pressed_keys = pygame.key.get_pressed()
-
-        for event in self.events:
-            if event.type == pygame.QUIT:
-                self.running = False
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-                self.running = False
-            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                x, y = self.screen2pos(event.pos)
-                self.add_object(Ball(self.space, x, y))
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_r:
-                self.add_new_rocket()
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_p:
-                self.run_physics = not self.run_physics
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_a:
-                self.rocket.airbrakes_enabled = not self.rocket.airbrakes_enabled
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_t:
-                if self.test is None:
-                    self.run_tests()
-            elif event.type == pygame.VIDEORESIZE:
-                self.FRAME_WIDTH = event.w
-                self.FRAME_HEIGHT = event.h
-                self.screen = pygame.display.set_mode(
-                    (self.FRAME_WIDTH, self.FRAME_HEIGHT), pygame.RESIZABLE)
-
-        # handle unit tests
-        if self.test is not None:
-            if self.test.is_finished():
-                self.test = self.test.next_test
-                if self.test is not None:
-                    self.test.start(self)
+            self.time += dt
+            self.physics_steps += 1
+            # the running test watches for the touchdown
+            if self.test is not None:
+                self.test.record_touchdown()
+            # record telemetry
+            if self.recorder is not None:
+                self.recorder.record(self)
+
+    # update the physics by a given duration with adaptive time steps
+    def update_adaptive_physics(self, duration):
+        while duration > 1e-9:
+            bodies = [obj.body for obj in self.objects
+                      if obj.body.body_type == pymunk.Body.DYNAMIC]
+            velocities = [body.velocity for body in bodies]
+            dt = min(self.next_adaptive_dt(), duration)
+            self.update_physics(dt)
+            duration -= dt
+            # error control: the local error of the (semi-implicit) Euler
+            # integrator is estimated from the change of acceleration
+            error = 0
+            accelerations = {}
+            for body, velocity in zip(bodies, velocities):
+                acceleration = (body.velocity - velocity) / dt
+                if body in self.accelerations:
+                    change = acceleration - self.accelerations[body]
+                    error = max(error, 0.5 * dt * change.length)
+                accelerations[body] = acceleration
+            self.accelerations = accelerations
+            # adapt the step size to the estimated error
+            factor = 2
+            if error > 0:
+                factor = min(0.9 * math.sqrt(self.DT_TOLERANCE / error), 2)
+            self.adaptive_dt = min(max(dt * factor, self.DT), self.MAX_DT)
+
+    # the next adaptive time step, refined near contacts and fast rotations
+    def next_adaptive_dt(self):
+        dt = self.adaptive_dt
+        for obj in self.objects:
+            body = obj.body
+            if body.body_type != pymunk.Body.DYNAMIC:
+                continue
+            # use the fixed time step while a rocket's pilot needs it
+            if isinstance(obj, Rocket) and obj.pilot.needs_fixed_dt():
+                return self.DT
+            # limit the rotation per time step
+            w = abs(body.angular_velocity)
+            if w * dt > self.MAX_ANGLE_STEP:
+                dt = max(self.MAX_ANGLE_STEP / w, self.DT)
+            # use the fixed time step close to any contact
+            if self.near_contact(obj, dt):
+                return self.DT
+        return dt
+
+    # check whether an object may touch another shape within time dt
+    def near_contact(self, obj, dt):
+        reach = obj.body.velocity.length * dt + self.CONTACT_MARGIN
+        bbs = [shape.bb for shape in obj.shapes]
+        bb = pymunk.BB(min(bb.left for bb in bbs) - reach,
+                       min(bb.bottom for bb in bbs) - reach,
+                       max(bb.right for bb in bbs) + reach,
+                       max(bb.top for bb in bbs) + reach)
+        for shape in self.space.bb_query(bb, pymunk.ShapeFilter()):
+            if shape.body is not obj.body:
+                return True
+        return False
+
+    # number of physics steps per rendered frame
+    def physics_steps_per_frame(self):
+        return int(1 / self.DT / self.FPS)
+
+    # apply the aerodynamic drag of all passive objects in bulk, as a change
+    # of their velocity over a time dt, scaled by the DRAG setting
+    def update_passive_drag(self, dt):
+        if not self.run_physics or not self.DRAG:
+            return
+        atmosphere = self.atmosphere
+        # bodies at rest are skipped in the large scene mode, setting their
+        # velocity would keep them from falling asleep
+        rest_speed = self.rest_speed
+        for obj in self.objects.passive:
+            body = obj.body
+            if body.is_sleeping:
+                continue
+            vx, vy = body.velocity
+            if abs(vx) < rest_speed and abs(vy) < rest_speed:
+                continue
+            height = body.position.y
+            wind = atmosphere.wind(height)
+            k = obj._drag_factor(obj.drag_area * self.DRAG,
+                                 math.hypot(vx - wind, vy), 1e-3,
+                                 atmosphere.density(height))
+            # implicit (always stable) update of dv/dt = -k/m * (v - wind)
+            a = k * dt / body.mass
+            f = 1 / (1 + a)
+            body.velocity = (vx + a * wind) * f, vy * f
+
+    # update the physics for the duration of one frame
+    def update_frame_physics(self):
+        n_steps = self.physics_steps_per_frame()
+        if self.FLOATING_ORIGIN:
+            with self.profiler.section("physics.origin"):
+                self.update_origin()
+        with self.profiler.section("physics.ground"):
+            self.ground.update(self)
+        if self.large_scene:
+            with self.profiler.section("physics.large_scene"):
+                self.update_large_scene()
+        with self.profiler.section("physics.passive_drag"):
+            self.update_passive_drag(n_steps * self.DT)
+        if self.ADAPTIVE_DT:
+            self.update_adaptive_physics(n_steps * self.DT)
+            return
+        for _ in range(n_steps):
+            self.update_physics()
+
+    # run the game without rendering for a given amount of simulated time,
+    # or until the optional condition until(game) is met
+    def simulate(self, duration, until=None):
+        t_end = self.time + duration
+        while self.running and self.time < t_end:
+            self.handle_controls()
+            if until is not None and until(self):
+                break
+            self.update_frame_physics()
+
+    # process the controls of the game (events, pressed keys, etc.),
+    # the input is read from pygame unless it is given
+    def handle_controls(self, events=None, pressed_keys=None):
+
+        with self.profiler.section("controls"):
+            if events is None:
+                events, pressed_keys = [], KeyState()
+                if not self.headless:
+                    events = pygame.event.get()
+                    pressed_keys = pygame.key.get_pressed()
+            if self.replay is not None:
+                events, pressed_keys = self.replay.process_input(
+                    self, events, pressed_keys)
+            self.events, self.pressed_keys = events, pressed_keys
+            self.frame += 1
+
+            for event in self.events:
+                if event.type == pygame.QUIT:
+                    self.running = False
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                    self.running = False
+                elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    x, y = self.screen2pos(event.pos)
+                    self.add_object(Ball(self.space, x, y))
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_r:
+                    self.add_new_rocket()
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_p:
+                    self.run_physics = not self.run_physics
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_a:
+                    self.rocket.airbrakes_enabled = not self.rocket.airbrakes_enabled
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_t:
+                    if self.test is None:
+                        self.run_tests()
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.profiler.toggle_overlay()
+                elif event.type == pygame.VIDEORESIZE:
+                    self.resize(event.w, event.h)
 
-        # update rocket controls
-        self.rocket.handle_controls(self)
+            # handle unit tests
+            if self.test is not None:
+                if self.test.is_finished():
+                    self.test = self.test.next_test
+                    if self.test is not None:
+                        self.test.start(self)
+
+            # update rocket controls
+            self.rocket.handle_controls(self)
+
+    # resize the window (a display call, only on the main thread)
+    def resize(self, width, height):
+        self.FRAME_WIDTH = width
+        self.FRAME_HEIGHT = height
+        if not self.headless:
+            self.screen = pygame.display.set_mode(
+                (self.FRAME_WIDTH, self.FRAME_HEIGHT), pygame.RESIZABLE)
 
     # draw the game
     def draw(self):
-        # Clear screen
-        self.screen.fill(pygame.Color("white"))
-        # Draw background
-        x, y = self.rocket.body.position
-        color = (240, 240, 240)
-        dist = 700
-        offsx, offsy = -x % dist, y % dist
-        for i in range(-1, 5):
-            pygame.draw.rect(self.screen, color,
-                             (offsx + i*dist, 0, dist/20, self.FRAME_HEIGHT))
-            pygame.draw.rect(self.screen, color,
-                             (0, offsy + i*dist, self.FRAME_WIDTH, dist/20))
-        # Draw objects
-        for obj in self.objects:
-            obj.draw(self)
-        # Display some text
-        font = pygame.font.Font(None, 24)
-
-        thrust = self.rocket.engine.thrust/self.rocket.engine.MAX_THRUST
-        twr = self.rocket.twr()
-        h = self.length_unit(self.rocket.body.position.y)
-        v = self.velocity_unit(self.rocket.body.velocity.y)
-        sas = self.rocket.pilot.sas_mode
-        text = f"""Thrust: {thrust:3.0%}
-TWR: {twr:.2f}
-Height: {h}
-Velocity: {v}
-SAS: {sas}
-
-Controls:
----------
-Up/Down - throttle
-Left/Right - thrust vector control
-space - start/stop engine
-0-4 - switch SAS mode
-mouse - add obstacle
-A - airbrakes
-P - pause
-R - restart
-T - run tests
-"""
-        y = 5
-        for line in text.splitlines():
-            text = font.render(line, True, pygame.Color("black"))
-            self.screen.blit(text, (5, y))
-            y += 20
+        profiler = self.profiler
+        with profiler.section("draw.background"):
+            # Clear screen
+            self.screen.fill(pygame.Color("white"))
+            # Draw background (fixed to the world, not to the Space)
+            x, y = self.to_world(self.draw_pose(self.rocket.body)[0])
+            color = (240, 240, 240)
+            dist = 700
+            offsx, offsy = -x % dist, y % dist
+            for i in range(-1, 5):
+                pygame.draw.rect(self.screen, color,
+                                 (offsx + i*dist, 0, dist/20, self.FRAME_HEIGHT))
+                pygame.draw.rect(self.screen, color,
+                                 (0, offsy + i*dist, self.FRAME_WIDTH, dist/20))
+        # Draw objects, skipping those out of view
+        with profiler.section("draw.objects"):
+            visible = self.visible_objects()
+            for obj in self.objects:
+                if obj in visible:
+                    obj.draw(self)
+        # Display the HUD and the profiler overlay
+        with profiler.section("draw.hud"):
+            self.hud.draw(self)
+        profiler.draw(self)
+
+    # the visible area in global coordinates (with a margin)
+    def view_bb(self):
+        x, y = self.screen2pos((0, 0))
+        margin = self.VIEW_MARGIN
+        return pymunk.BB(x - margin, y - self.FRAME_HEIGHT - margin,
+                         x + self.FRAME_WIDTH + margin, y + margin)
+
+    # the set of objects that are (at least partially) in view
+    def visible_objects(self):
+        shapes = self.space.bb_query(self.view_bb(), pymunk.ShapeFilter())
+        owner = self.objects.owner
+        return {owner(shape) for shape in shapes} - {None}
+
+    # the position and angle at which a body is drawn (see draw_poses)
+    def draw_pose(self, body):
+        if self.draw_poses is not None:
+            pose = self.draw_poses.get(body)
+            if pose is not None:
+                return pose
+        return body.position, body.angle
+
+    # transform coordinates local to a body to global coordinates, at the
+    # pose at which the body is drawn
+    def local2pos(self, body, point):
+        position, angle = self.draw_pose(body)
+        return position + Vec2d(*point).rotated(angle)
+
+    # offset from global to (flipped) screen coordinates
+    def screen_offset(self):
+        x = self.FRAME_WIDTH / 2.
+        y = -self.FRAME_HEIGHT / 2.
+        if self.rocket is not None:
+            rx, ry = self.draw_pose(self.rocket.body)[0]
+            x -= rx
+            y -= ry
+        return x, y
 
     # transform global coordinates to screen coordinates
     def pos2screen(self, pos):
-        x = pos.x + self.FRAME_WIDTH / 2.
-        y = pos.y - self.FRAME_HEIGHT / 2.
-        if self.rocket is not None:
-            x -= self.rocket.body.position.x
-            y -= self.rocket.body.position.y
-        return int(x), -int(y)
+        ox, oy = self.screen_offset()
+        return int(pos[0] + ox), -int(pos[1] + oy)
+
+    # transform a list of global coordinates to screen coordinates
+    def points2screen(self, points):
+        ox, oy = self.screen_offset()
+        return [(int(x + ox), -int(y + oy)) for x, y in points]
+
+    # transform a list of coordinates local to a body to screen coordinates
+    # (at the pose at which the body is drawn)
+    def local2screen(self, body, points):
+        (bx, by), angle = self.draw_pose(body)
+        c, s = math.cos(angle), math.sin(angle)
+        ox, oy = self.screen_offset()
+        bx += ox
+        by += oy
+        return [(int(x*c - y*s + bx), -int(x*s + y*c + by)) for x, y in points]
 
     # transform screen coordinates to global coordinates
     def screen2pos(self, pos):
         x = pos[0] - self.FRAME_WIDTH / 2.
         y = -pos[1] + self.FRAME_HEIGHT / 2.
         if self.rocket is not None:
-            x += self.rocket.body.position.x
-            y += self.rocket.body.position.y
+            rx, ry = self.draw_pose(self.rocket.body)[0]
+            x += rx
+            y += ry
         return Vec2d(x, y)
 
     # convert lengthlength_unitto string with units
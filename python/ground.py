@@ -0,0 +1,74 @@
+from collections import OrderedDict
+import pymunk
+from objects import GroundChunk
+
+
+class Ground():
+    """
+    The ground of a game, built from the chunks of its terrain (see
+    terrain.Terrain and objects.GroundChunk) as the rocket moves. Only the
+    chunks within LOAD_DISTANCE of the rocket, those in view and those
+    under (or next to) a dynamic object are in the pymunk Space and the
+    game, so that the cost of collisions and drawing stays proportional to
+    the area that matters. The objects are rechecked every KEEP_INTERVAL
+    frames. The chunks taken out of the Space are kept for reuse, up to
+    CACHE_SIZE of the least recently used ones.
+    The loaded chunks are looked up in the game's objects, so the ground
+    stays consistent when a snapshot of the game is restored.
+    The chunks are indexed by world coordinates, so that they do not change
+    when the origin of the Space moves (see RocketGame.move_origin).
+    """
+
+    LOAD_DISTANCE = 2000  # in m
+    KEEP_INTERVAL = 10  # in frames
+    CACHE_SIZE = 32  # in chunks
+
+    def __init__(self, terrain):
+        self.terrain = terrain
+        # the chunks out of the Space {index: chunk}, least recent first
+        self.cache = OrderedDict()
+        # indices of the chunks under the dynamic objects
+        self.occupied = set()
+        # statistics: number of built chunks
+        self.built = 0
+
+    # the chunks that need to be in the Space
+    def needed_chunks(self, game):
+        terrain = self.terrain
+        ox = game.origin.x
+        x = game.region_of_interest().x + ox
+        bb = game.view_bb()
+        ranges = [(x - self.LOAD_DISTANCE, x + self.LOAD_DISTANCE),
+                  (bb.left + ox, bb.right + ox)]
+        if game.frame % self.KEEP_INTERVAL == 0:
+            self.occupied = {
+                terrain.chunk_index(body.position.x + ox)
+                for body in game.objects.body_objects
+                if body.body_type == pymunk.Body.DYNAMIC}
+            self.occupied |= {index + 1 for index in self.occupied} | \
+                {index - 1 for index in self.occupied}
+        needed = set(self.occupied)
+        for left, right in ranges:
+            needed.update(range(terrain.chunk_index(left),
+                                terrain.chunk_index(right) + 1))
+        return needed
+
+    # add the needed chunks to the game and remove the others
+    def update(self, game):
+        needed = self.needed_chunks(game)
+        loaded = {chunk.index: chunk
+                  for chunk in game.objects.of_type(GroundChunk)}
+        for index, chunk in loaded.items():
+            if index not in needed:
+                game.remove_object(chunk)
+                self.cache[index] = chunk
+                self.cache.move_to_end(index)
+        for index in sorted(needed - loaded.keys()):
+            chunk = self.cache.pop(index, None)
+            if chunk is None:
+                chunk = GroundChunk(self.terrain, index)
+                self.built += 1
+            chunk.place()
+            game.add_object(chunk)
+        while len(self.cache) > self.CACHE_SIZE:
+            self.cache.popitem(last=False)
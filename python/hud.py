@@ -0,0 +1,92 @@
+import time
+import pygame
+
+
+class Hud():
+    """
+    Heads-up display with the rocket telemetry and the controls help.
+    The font is created once and the static help text is pre-rendered into
+    a single surface. Telemetry lines are only re-rendered when their text
+    changes. The number of rendered lines and the time spent are measured
+    for each frame.
+    """
+
+    FONT_SIZE = 24
+    LINE_HEIGHT = 20  # in px
+    COLOR = "black"
+    HELP = """
+Controls:
+---------
+Up/Down - throttle
+Left/Right - thrust vector control
+space - start/stop engine
+0-5 - switch SAS mode
+mouse - add obstacle
+A - airbrakes
+V - predicted trajectory
+P - pause
+R - restart
+T - run tests
+F3 - profiler"""
+
+    def __init__(self):
+        # font and pre-rendered surfaces (created on the first draw)
+        self.font = None
+        self.help_surface = None
+        # cache of the rendered telemetry lines: list of (text, surface)
+        self.lines = []
+        # statistics of the last frame
+        self.renders = 0
+        self.draw_time = 0
+
+    # the telemetry lines for the current state of the game
+    def telemetry(self, game):
+        rocket = game.rocket
+        thrust = rocket.engine.thrust/rocket.engine.MAX_THRUST
+        capacity = sum(tank.capacity for tank in rocket.tanks)
+        fuel = rocket.fuel / capacity if capacity else 0
+        height = game.to_world(rocket.body.position).y
+        return [
+            f"Thrust: {thrust:3.0%}",
+            f"Fuel: {fuel:3.0%}",
+            f"TWR: {rocket.twr():.2f}",
+            f"Height: {game.length_unit(height)}",
+            f"Velocity: {game.velocity_unit(rocket.body.velocity.y)}",
+            f"SAS: {rocket.pilot.sas_mode}",
+        ]
+
+    # render a line of text
+    def render(self, text):
+        self.renders += 1
+        return self.font.render(text, True, pygame.Color(self.COLOR))
+
+    # render a block of lines into one (transparent) surface
+    def render_block(self, text):
+        lines = text.splitlines()
+        width = max(self.font.size(line)[0] for line in lines)
+        surface = pygame.Surface(
+            (width, len(lines) * self.LINE_HEIGHT), pygame.SRCALPHA)
+        for i, line in enumerate(lines):
+            surface.blit(self.render(line), (0, i * self.LINE_HEIGHT))
+        return surface
+
+    # draw the HUD on the game's screen
+    def draw(self, game):
+        t = time.perf_counter()
+        self.renders = 0
+        if self.font is None:
+            self.font = pygame.font.Font(None, self.FONT_SIZE)
+            self.help_surface = self.render_block(self.HELP)
+        # telemetry, re-rendered only where the text changed
+        texts = self.telemetry(game)
+        if len(self.lines) != len(texts):
+            self.lines = [(None, None)] * len(texts)
+        y = 5
+        for i, text in enumerate(texts):
+            if self.lines[i][0] != text:
+                self.lines[i] = text, self.render(text)
+            game.screen.blit(self.lines[i][1], (5, y))
+            y += self.LINE_HEIGHT
+        # static help text
+        game.screen.blit(self.help_surface, (5, y))
+        self.draw_time = time.perf_counter() - t
@@ -1,27 +1,90 @@
 #!/usr/bin/python3
 
+import sys
 import pygame
 from game import RocketGame
 
+# large scenes with many obstacles (--large-scene): spatial hashing,
+# sleeping bodies and despawning of far objects (see RocketGame.LARGE_SCENE)
+RocketGame.LARGE_SCENE = "--large-scene" in sys.argv
+
+# hills of up to a given height instead of a flat ground (--terrain HEIGHT)
+if "--terrain" in sys.argv:
+    RocketGame.TERRAIN_AMPLITUDE = float(
+        sys.argv[sys.argv.index("--terrain") + 1])
+
+# long-range flights (--floating-origin): the origin of the Space follows
+# the rocket (see RocketGame.FLOATING_ORIGIN)
+RocketGame.FLOATING_ORIGIN = "--floating-origin" in sys.argv
+
+# profile the game loop (--profile), the profile is printed at the end,
+# or saved as JSON (--profile FILE.json)
+PROFILE = "--profile" in sys.argv
+
+
+def dump_profile(game):
+    args = sys.argv[sys.argv.index("--profile") + 1:]
+    game.profiler.dump(args[0] if args and args[0][0] != "-" else None)
+
+
+# run the landing tests without a display, at full simulation speed,
+# optionally recording the telemetry to a file (--telemetry FILE)
+if "--headless" in sys.argv:
+    game = RocketGame(headless=True)
+    if "--telemetry" in sys.argv:
+        from telemetry import TelemetryRecorder
+        game.recorder = TelemetryRecorder()
+    if PROFILE:
+        game.profiler.start()
+    game.run_tests()
+    game.simulate(3600, until=lambda game: game.test is None)
+    if game.recorder is not None:
+        game.recorder.export(sys.argv[sys.argv.index("--telemetry") + 1])
+    if PROFILE:
+        dump_profile(game)
+    sys.exit()
+
 # initalize pygame
 pygame.init()
 
 # create the game
 game = RocketGame()
+if PROFILE:
+    game.profiler.start()
+
+# optionally record the input into a replay log (--record FILE),
+# it can be played back with replay.py
+if "--record" in sys.argv:
+    from replay import ReplayRecorder
+    game.replay = ReplayRecorder(sys.argv[sys.argv.index("--record") + 1],
+                                 game)
+
+# run the physics on its own thread at a fixed rate, decoupled from the
+# rendering at display rate (--threaded)
+if "--threaded" in sys.argv:
+    from physics_thread import PhysicsThread
+    physics = PhysicsThread(game)
+    physics.start()
+    while game.running:
+        physics.post_input(pygame.event.get(), pygame.key.get_pressed())
+        physics.draw()
+        pygame.display.flip()
+        game.clock.tick(physics.RENDER_FPS)
+        pygame.display.set_caption(physics.status())
+    physics.stop()
 
 n = 0
 while game.running:
 
     # calculate number of physical steps and resulting frames per second
-    n_physics_steps = int(1 / game.DT / game.FPS)
+    n_physics_steps = game.physics_steps_per_frame()
     fps = 1 / game.DT / n_physics_steps
 
     # Process the controls of the game (events, pressed keys, etc.)
     game.handle_controls()
 
     # Update physics
-    for _ in range(n_physics_steps):
-        game.update_physics()
+    game.update_frame_physics()
 
     # Draw the game
     game.draw()
@@ -34,3 +97,9 @@ while game.running:
     if game.SAVE_IMG:
         pygame.image.save(game.screen, "out/{:08d}.png".format(n))
         n += 1
+
+if game.replay is not None:
+    game.replay.close()
+
+if PROFILE:
+    dump_profile(game)
@@ -1,6 +1,28 @@
 import pygame
 import pymunk
 from pymunk import Vec2d
+from atmosphere import STANDARD_ATMOSPHERE
+from terrain import FLAT_TERRAIN
+
+
+# clip the segment from p1 to p2 to a bounding box (Liang-Barsky),
+# returns the clipped end points or None if the segment is outside
+def clip_segment(bb, p1, p2):
+    t0, t1 = 0., 1.
+    dx, dy = p2[0] - p1[0], p2[1] - p1[1]
+    for p, q in ((-dx, p1[0] - bb.left), (dx, bb.right - p1[0]),
+                 (-dy, p1[1] - bb.bottom), (dy, bb.top - p1[1])):
+        if p == 0:
+            if q < 0:
+                return None
+        elif p < 0:
+            t0 = max(t0, q / p)
+        else:
+            t1 = min(t1, q / p)
+    if t0 > t1:
+        return None
+    return [Vec2d(p1[0] + t0 * dx, p1[1] + t0 * dy),
+            Vec2d(p1[0] + t1 * dx, p1[1] + t1 * dy)]
 
 
 class Object():
@@ -10,24 +32,77 @@ class Object():
         self.shape = None
         self.facecolor = "red"
         self.edgecolor = "blue"
+        # exposed area for the aerodynamic drag of passive objects
+        # (objects that implement update_drag handle their own drag)
+        self.drag_area = 0
+        # the air the object moves through (set by RocketGame.add_object)
+        self.atmosphere = STANDARD_ATMOSPHERE
+        # the ground the object moves over (set by RocketGame.add_object)
+        self.terrain = FLAT_TERRAIN
+
+    # the shapes of the object (one, unless the object overrides this)
+    @property
+    def shapes(self):
+        return [self.shape]
 
-    # update the external forces
-    def update_forces(self):
+    # update the external forces for a time step of length dt
+    def update_forces(self, dt):
         pass
 
-    # add the aerodynamic drag forces
-    def update_drag(self):
+    # add the aerodynamic drag forces for a time step of length dt
+    def update_drag(self, dt):
         pass
 
     # Calculate the aerodynamic drag force using the drag equation:
-    # F = coeff * A * v^2 (in direction of v)
-    def _drag_formula(self, area, velocity=None, coeff=1e-3):
+    # F = coeff * rho * A * v^2 (in direction of v), with the density rho
+    # and velocity v relative to the air at a given height
+    def _drag_formula(self, area, velocity=None, coeff=1e-3, height=None):
         if velocity is None:
             velocity = self.body.velocity
-        # v^2 in direction of v
-        v2 = velocity.length * velocity
-        # drag force equation
-        return -coeff * area * v2
+        if height is None:
+            height = self.body.position.y
+        atmosphere = self.atmosphere
+        wind = atmosphere.wind(height)
+        if wind:
+            velocity = velocity - (wind, 0)
+        # drag force equation, F = -k * v with k = coeff * rho * A * |v|
+        k = self._drag_factor(area, velocity.length, coeff,
+                              atmosphere.density(height))
+        return -k * velocity
+
+    # the factor k of the drag equation F = -k * v at a given speed
+    # (relative to the air) and air density
+    def _drag_factor(self, area, speed, coeff=1e-3, density=1):
+        return coeff * density * area * speed
+
+    # called when the origin of the Space moved by offset (see
+    # RocketGame.move_origin), after all bodies were moved by -offset
+    def shift_origin(self, offset):
+        pass
+
+    # get the state of the object, as plain immutable data (see set_state)
+    def get_state(self):
+        if self.body.body_type == pymunk.Body.STATIC:
+            return None
+        body = self.body
+        return body.position, body.velocity, body.angle, body.angular_velocity
+
+    # restore a state captured with get_state
+    def set_state(self, state):
+        if state is not None:
+            self.set_body_state(*state)
+
+    # set the position, velocity, angle and angular velocity of the body
+    # (the angle first, since pymunk rotates a body about its center of
+    # gravity, which moves its position unless that is the center)
+    def set_body_state(self, position, velocity, angle, angular_velocity):
+        body = self.body
+        body.angle = angle
+        body.position = position
+        body.velocity = velocity
+        body.angular_velocity = angular_velocity
+        if body.space is not None:
+            body.space.reindex_shapes_for_body(body)
 
     # draw the object on a game's screen
     def draw(self, game):
@@ -43,12 +118,13 @@ class Ball(Object):
         self.body.position = x, y
         self.shape = pymunk.Circle(self.body, radius, (0, 0))
         self.shape.friction = 0.8
+        self.drag_area = 2 * radius
         space.add(self.body, self.shape)
 
     def draw(self, game):
         r = self.shape.radius
-        v = self.body.position
-        rot = self.body.rotation_vector
+        v, angle = game.draw_pose(self.body)
+        rot = Vec2d(1, 0).rotated(angle)
         p = game.pos2screen(v)
         p2 = p + Vec2d(rot.x, -rot.y) * r * 0.9
         p2 = int(p2.x), int(p2.y)
@@ -67,12 +143,107 @@ class Wall(Object):
         space.add(self.shape)
 
     def draw(self, game):
-        pv1 = self.body.position + self.shape.a.rotated(self.body.angle)
-        pv2 = self.body.position + self.shape.b.rotated(self.body.angle)
-        p1 = game.pos2screen(pv1)
-        p2 = game.pos2screen(pv2)
+        pv1 = self.body.local_to_world(self.shape.a)
+        pv2 = self.body.local_to_world(self.shape.b)
+        # clip the segment to the visible area
+        ends = clip_segment(game.view_bb(), pv1, pv2)
+        if ends is None:
+            return
         pygame.draw.lines(game.screen, pygame.Color(
-            "black"), False, [p1, p2], 2)
+            "black"), False, game.points2screen(ends), 2)
+
+
+class GroundChunk(Object):
+    """
+    A chunk of the ground of a terrain (see terrain.Terrain), on a static
+    body of its own at the left edge of the chunk: LAYERS stacked polylines
+    of segments, LAYER_SPACING apart, through the vertices of the terrain
+    (with collinear ones merged), so that fast objects do not tunnel
+    through. The segments are linked to their neighbours, also across the
+    edges of the chunk, so that objects slide smoothly over the joints.
+    The body is placed at the world position of the chunk relative to the
+    origin of the Space (see Terrain.origin).
+    """
+
+    LAYERS = 4
+    LAYER_SPACING = 2  # in m
+    PAD_COLOR = 255, 140, 0
+
+    def __init__(self, terrain, index):
+        super().__init__()
+        self.index = index
+        self.terrain = terrain
+        x0, x1 = terrain.chunk_bounds(index)
+        self.x0 = x0
+        self.body = pymunk.Body(body_type=pymunk.Body.STATIC)
+        self.place()
+        # the top of the ground, in local coordinates (at world heights)
+        self.points = [Vec2d(x - x0, y)
+                       for x, y in self.merge(terrain.vertices(index))]
+        # the parts of the top on landing pads (as pairs of points)
+        self.pads = []
+        for center, width in terrain.pads:
+            left = max(center - width / 2, x0)
+            right = min(center + width / 2, x1)
+            if left < right:
+                self.pads.append(
+                    (Vec2d(left - x0, terrain.world_height(left)),
+                     Vec2d(right - x0, terrain.world_height(right))))
+        # the vertices just outside the chunk, for the neighbours
+        d = terrain.SEGMENT
+        before = Vec2d(-d, terrain.world_height(x0 - d))
+        after = Vec2d(x1 - x0 + d, terrain.world_height(x1 + d))
+        self.segments = []
+        for layer in range(self.LAYERS):
+            dy = Vec2d(0, -layer * self.LAYER_SPACING)
+            points = [p + dy for p in [before] + self.points + [after]]
+            for i in range(1, len(points) - 2):
+                segment = pymunk.Segment(self.body, points[i],
+                                         points[i + 1], 0.0)
+                segment.set_neighbors(points[i - 1], points[i + 2])
+                segment.friction = 0.99
+                self.segments.append(segment)
+
+    @property
+    def shapes(self):
+        return self.segments
+
+    # move the body to the chunk's position relative to the origin of the
+    # Space (if it is not there yet)
+    def place(self):
+        ox, oy = self.terrain.origin
+        position = Vec2d(self.x0 - ox, -oy)
+        body = self.body
+        if body.position != position:
+            body.position = position
+            if body.space is not None:
+                body.space.reindex_shapes_for_body(body)
+
+    def shift_origin(self, offset):
+        self.place()
+
+    # the position of a chunk follows from the terrain, so that it is also
+    # right when a snapshot is restored after the origin moved
+    def set_state(self, state):
+        self.place()
+
+    # drop the vertices that lie on a straight line between their
+    # neighbours
+    @staticmethod
+    def merge(vertices):
+        merged = vertices[:1]
+        for (x1, y1), (x2, y2) in zip(vertices[1:], vertices[2:]):
+            x0, y0 = merged[-1]
+            if abs((y1 - y0) * (x2 - x1) - (y2 - y1) * (x1 - x0)) > 1e-9:
+                merged.append((x1, y1))
+        return merged + vertices[-1:]
+
+    def draw(self, game):
+        pygame.draw.lines(game.screen, pygame.Color("black"), False,
+                          game.local2screen(self.body, self.points), 2)
+        for pad in self.pads:
+            pygame.draw.lines(game.screen, pygame.Color(*self.PAD_COLOR),
+                              False, game.local2screen(self.body, pad), 4)
 
 
 class HWall(Wall):
@@ -90,14 +261,12 @@ class Poly(Object):
         self.body.position = x, y
         self.shape = pymunk.Poly(self.body, points)
         self.shape.friction = 0.8
+        self.drag_area = max(max(abs(x), abs(y)) for x, y in points) * 2
         space.add(self.body, self.shape)
 
     def draw(self, game):
-        ps = [p.rotated(self.body.angle) +
-              self.body.position for p in self.shape.get_vertices()]
+        ps = game.local2screen(self.body, self.shape.get_vertices())
         ps.append(ps[0])
-        for i, p in enumerate(ps):
-            ps[i] = game.pos2screen(p)
         pygame.draw.lines(game.screen, pygame.Color(
             self.edgecolor), False, ps, 2)
 
@@ -0,0 +1,149 @@
+import time
+import threading
+import pygame
+import pymunk
+from game import KeyState
+
+
+class PhysicsThread(threading.Thread):
+    """
+    Runs the controls and physics of a game on their own thread, at a fixed
+    rate of game.FPS physics frames per second of real time, so that slow
+    rendering does not slow down the simulated time.
+    The main thread passes the user input with post_input() (window resizes
+    are handled on the main thread, like all display calls) and draws with
+    draw(), which shows the dynamic bodies interpolated between the last two
+    physics frames, at any display rate (also across a move of the origin
+    of the Space, see RocketGame.move_origin), without moving the bodies.
+    A lock keeps both threads from touching the game at the same time.
+    Both report how far they fall behind real time: physics_lag is the delay
+    of the last physics frame behind its schedule, render_lag the delay of
+    the last drawn frame behind the display rate.
+    """
+
+    RENDER_FPS = 60  # display rate, in frames per second
+    MAX_LAG = 0.25  # physics lag after which the physics skips ahead, in s
+
+    def __init__(self, game):
+        super().__init__(daemon=True)
+        self.game = game
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+        # user input posted by the main thread since the last physics frame
+        self.input_lock = threading.Lock()
+        self.events = []
+        self.pressed_keys = KeyState()
+
+        # (position, angle) of the dynamic bodies in the last two physics
+        # frames, the origin of the Space in the previous one and the real
+        # time at which the last one was published
+        self.previous = {}
+        self.current = {}
+        self.previous_origin = game.origin
+        self.t_published = None
+        self.t_drawn = None
+
+        # statistics
+        self.physics_frames = 0
+        self.physics_lag = 0  # in s
+        self.skipped_time = 0  # real time skipped by the physics, in s
+        self.render_lag = 0  # in s
+
+    # pass the user input (events, pressed keys) to the physics thread,
+    # except for window resizes: they are display calls, which stay on the
+    # main thread, so the game is resized here
+    def post_input(self, events, pressed_keys):
+        resizes = [event for event in events
+                   if event.type == pygame.VIDEORESIZE]
+        if resizes:
+            with self.lock:
+                self.game.resize(resizes[-1].w, resizes[-1].h)
+            events = [event for event in events
+                      if event.type != pygame.VIDEORESIZE]
+        with self.input_lock:
+            self.events.extend(events)
+            self.pressed_keys = pressed_keys
+
+    # run physics frames on schedule until stopped or the game ends
+    def run(self):
+        period = 1 / self.game.FPS
+        deadline = time.perf_counter()
+        while self.game.running and not self.stopped.is_set():
+            now = time.perf_counter()
+            if now < deadline:
+                self.stopped.wait(deadline - now)
+                continue
+            self.physics_lag = now - deadline
+            # do not try to catch up when too far behind
+            if self.physics_lag > self.MAX_LAG:
+                self.skipped_time += self.physics_lag
+                deadline = now
+            # run all frames that are due at once, so that a slow draw
+            # holding the lock does not slow down the simulated time
+            n_frames = int((now - deadline) / period) + 1
+            self.update_frames(n_frames)
+            deadline += n_frames * period
+
+    # process the input and update the physics for a number of frames
+    def update_frames(self, n_frames=1):
+        with self.input_lock:
+            events, self.events = self.events, []
+            pressed_keys = self.pressed_keys
+        game = self.game
+        with self.lock:
+            for n in range(n_frames):
+                if n == n_frames - 1:
+                    self.previous = self.body_states()
+                    self.previous_origin = game.origin
+                game.handle_controls(events if n == 0 else [], pressed_keys)
+                game.update_frame_physics()
+            self.current = self.body_states()
+            self.t_published = time.perf_counter()
+            self.physics_frames += n_frames
+
+    # the (position, angle) of all dynamic bodies of the game
+    def body_states(self):
+        return {obj.body: (obj.body.position, obj.body.angle)
+                for obj in self.game.objects
+                if obj.body.body_type == pymunk.Body.DYNAMIC}
+
+    # stop the physics thread and wait for it to finish
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+
+    # draw the game, interpolated between the last two physics frames
+    def draw(self):
+        game = self.game
+        with self.lock:
+            now = time.perf_counter()
+            if self.t_drawn is not None:
+                self.render_lag = max(
+                    now - self.t_drawn - 1 / self.RENDER_FPS, 0)
+            self.t_drawn = now
+            alpha = 1
+            if self.t_published is not None:
+                alpha = min((now - self.t_published) * game.FPS, 1)
+            # draw the bodies at their interpolated state, the bodies
+            # themselves are not touched (see RocketGame.draw_poses), the
+            # previous positions are relative to the current origin
+            shift = self.previous_origin - game.origin
+            poses = {}
+            for body, (p1, a1) in self.current.items():
+                p0, a0 = self.previous.get(body, (p1 - shift, a1))
+                p0 = p0 + shift
+                poses[body] = (p0 + (p1 - p0) * alpha, a0 + (a1 - a0) * alpha)
+            game.draw_poses = poses
+            try:
+                game.draw()
+            finally:
+                game.draw_poses = None
+
+    # a status line with the frame rate and lags
+    def status(self):
+        return (f"fps: {int(self.game.clock.get_fps())}, "
+                f"physics lag: {self.physics_lag*1e3:.0f}ms, "
+                f"render lag: {self.render_lag*1e3:.0f}ms, "
+                f"skipped: {self.skipped_time:.1f}s")
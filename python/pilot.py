@@ -1,5 +1,7 @@
 import math
 import pygame
+from trajectory import TrajectoryPredictor
+from planner import LandingPlanner
 
 
 class Pilot():
@@ -10,12 +12,50 @@ class Pilot():
     def handle_constrols(self, game):
         pass
 
+    # get the state of the pilot (see set_state)
+    def get_state(self):
+        return None
+
+    # restore a state captured with get_state
+    def set_state(self, state):
+        pass
+
+    # draw pilot information on the game's screen
+    def draw(self, game):
+        pass
+
 
 class Autopilot(Pilot):
 
+    # gains of the SAS control laws, these can be tuned with autotune.py
+    GAINS = {
+        # fraction of the angular velocity cancelled per frame ("assist")
+        "assist_damping": 0.1,
+        # damping of the angular velocity while steering, in s
+        "steering_damping": 0.4,
+        # weight of the momentum (against gravity) in the target direction
+        "momentum_weight": 1e0,
+        # largest scaling of the thrust to its vertical component
+        "hover_cos_cap": 2,
+        "land_cos_cap": 4,
+        # safety factor of the thrust in the "land (heuristic)" mode
+        "land_safety": 0.75,
+    }
+    # the gains that each SAS mode reads
+    MODE_GAINS = {
+        "OFF": (),
+        "assist": ("assist_damping",),
+        "stabilize": ("steering_damping",),
+        "hover": ("steering_damping", "momentum_weight", "hover_cos_cap"),
+        "land": ("steering_damping",),
+        "land (heuristic)": ("steering_damping", "momentum_weight",
+                             "land_cos_cap", "land_safety"),
+    }
+
     def __init__(self, rocket):
         super().__init__(rocket)
         self.sas_mode = "OFF"
+        self.gains = dict(self.GAINS)
 
         # dict of SAS modes and associated keys
         self.SAS_modes = {
@@ -23,13 +63,21 @@ class Autopilot(Pilot):
             pygame.K_1: "assist",
             pygame.K_2: "stabilize",
             pygame.K_3: "hover",
-            pygame.K_4: "land"
+            pygame.K_4: "land",
+            pygame.K_5: "land (heuristic)"
         }
 
+        # prediction of the ballistic trajectory
+        self.predictor = TrajectoryPredictor(rocket)
+        self.show_trajectory = False
+        # planner of the powered descent in the "land" mode
+        self.planner = LandingPlanner(rocket)
+
     def handle_controls(self, game):
 
         # apply the auto controls
-        self.auto_controls(game)
+        with game.profiler.section("autopilot"):
+            self.auto_controls(game)
 
         # apply the user controls
         for event in game.events:
@@ -39,10 +87,13 @@ class Autopilot(Pilot):
             elif event.type == pygame.KEYDOWN and event.key in self.SAS_modes:
                 self.sas_mode = self.SAS_modes[event.key]
                 self.rocket.engine.ignited = True
+            # toggle the predicted trajectory
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_v:
+                self.show_trajectory = not self.show_trajectory
 
         # for some SAS modes, we give user controls a higher weight
         servo = 1
-        if self.sas_mode in ["hover", "land", "stabilize"]:
+        if self.sas_mode in ["hover", "land", "land (heuristic)", "stabilize"]:
             servo = 8
 
         # handle pressed keys
@@ -68,6 +119,12 @@ class Autopilot(Pilot):
         angle = telemetry["angle"]
         velocity = telemetry["velocity"]
         angular_velocity = telemetry["angular_velocity"]
+        mass = telemetry["mass"]
+        gains = self.gains
+
+        # update the predicted trajectory, this provides the predicted
+        # impact point and time to impact
+        self.predictor.update(game.time)
 
         # no stability assist
         if self.sas_mode == "OFF":
@@ -76,49 +133,77 @@ class Autopilot(Pilot):
         # keep the rocket stable by cancelling angular velocity
         if self.sas_mode == "assist":
             # slowly cancel angular angular velocity
-            engine.increase_angle(-0.1*angular_velocity)
+            engine.increase_angle(-gains["assist_damping"]*angular_velocity)
+
+        # plan the landing, this gives the engine controls and the target
+        # direction of the rocket
+        if self.sas_mode == "land":
+            with game.profiler.section("autopilot.plan"):
+                ignite, thrust, target_direction = \
+                    self.planner.update(game, telemetry)
 
         # cancel rocket angle and lateral velocity
-        if self.sas_mode in ["hover", "land", "stabilize"]:
+        if self.sas_mode in ["hover", "land", "land (heuristic)",
+                             "stabilize"]:
             # get target direction of rocket from a superposition of gravity
             # force and momentum vector (this cancels horizontal velocity)
-            gravity = rocket.space.gravity
-            momentum = velocity
-            if self.sas_mode == "stabilize":
-                momentum *= 0
-            target_direction = 1e0 * momentum + gravity
+            if self.sas_mode != "land":
+                gravity = rocket.space.gravity
+                momentum = velocity
+                if self.sas_mode == "stabilize":
+                    momentum *= 0
+                target_direction = gains["momentum_weight"] * momentum + \
+                    gravity
             target_angle = math.atan2(target_direction.x, -target_direction.y)
             # set thrust angle so that the rocket approaches target direction
             thrust_angle = target_angle - angle
             # cancel angular velocity
-            thrust_angle -= 0.4*angular_velocity
+            thrust_angle -= gains["steering_damping"]*angular_velocity
             # apply thrust_angle to engine
             engine.set_angle(thrust_angle)
 
         # control engine thrust for hovering (no vertical velocity)
         if self.sas_mode == "hover":
             # set TWR = 1
-            thrust = rocket.mass * abs(rocket.space.gravity[1])
+            thrust = mass * abs(rocket.space.gravity[1])
             # cancel vertical velocity
-            thrust -= rocket.mass * velocity.y
+            thrust -= mass * velocity.y
             # scale thrust to vertical component
-            thrust *= min(1. / abs(math.cos(engine.angle - angle)), 2)
+            thrust *= min(1. / abs(math.cos(engine.angle - angle)),
+                          gains["hover_cos_cap"])
             # apply thrust to engine
             engine.set_thrust(thrust)
 
-        # control thrust for landing
+        # control thrust for landing, as planned
         if self.sas_mode == "land":
+            engine.set_thrust(thrust)
+            if ignite:
+                engine.ignite()
+            else:
+                engine.cut_off()
+            # the airbrakes keep the tail of the rocket pointing forward
+            rocket.airbrakes_enabled = True
+            # stop landing mode after touchdown
+            if self.planner.phase == "landed":
+                rocket.airbrakes_enabled = False
+                self.sas_mode = "OFF"
+
+        # control thrust for landing (with a simple control law)
+        if self.sas_mode == "land (heuristic)":
             # some abbreviations
-            h = position.y - rocket.h / 1.9  # target height
+            # height above the base level of the ground
+            height = rocket.terrain.altitude(position.x, position.y)
+            h = height - rocket.h / 1.9  # target height
             v = velocity.y
-            m = rocket.mass
+            m = mass
             g = abs(rocket.space.gravity[1])
             # calculate the necessary thrust for landing
             thrust = 2 * v**2 * m / h + g
             # scale thrust to vertical component
-            thrust *= min(1. / abs(math.cos(engine.angle - angle)), 4)
+            thrust *= min(1. / abs(math.cos(engine.angle - angle)),
+                          gains["land_cos_cap"])
             # safety factor: costs fuel, but makes the landing more gentle
-            thrust *= 0.75
+            thrust *= gains["land_safety"]
             # no thrust if going upwards of if thrust would be too low
             if v > 0 or thrust < engine.MIN_THRUST:
                 engine.cut_off()
@@ -129,11 +214,39 @@ class Autopilot(Pilot):
             # enable airbrakes
             rocket.airbrakes_enabled = True
             # kill thrust and stop landing mode when too low
-            if position.y < rocket.h / 1.8:
+            if height < rocket.h / 1.8:
                 engine.ignited = False
                 rocket.airbrakes_enabled = False
                 self.sas_mode = "OFF"
 
+    # get the state of the autopilot (see set_state)
+    def get_state(self):
+        return self.sas_mode, self.planner.get_state()
+
+    # restore a state captured with get_state, the cached prediction of
+    # the trajectory does not belong to the old state anymore
+    def set_state(self, state):
+        self.sas_mode, planner = state
+        self.planner.set_state(planner)
+        self.predictor.clear()
+
+    # whether the physics has to use its fixed time step (see
+    # RocketGame.next_adaptive_dt): the planned burn and descent assume the
+    # dynamics of fixed steps, with large steps the rocket lags behind
+    # its plan
+    def needs_fixed_dt(self):
+        return self.sas_mode == "land" and \
+            self.planner.phase in ("burn", "descent")
+
+    # the prediction moves along with the origin of the Space
+    def shift_origin(self, offset):
+        self.predictor.shift(offset)
+
+    # the predicted ballistic trajectory of the rocket (list of positions)
     def trajectory(self):
-        # TODO: estimate the trajectory of the rocket
-        pass
+        return self.predictor.trajectory()
+
+    # draw the predicted trajectory
+    def draw(self, game):
+        if self.show_trajectory:
+            self.predictor.draw(game)
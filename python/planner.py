@@ -0,0 +1,367 @@
+import math
+
+
+class LandingPlanner():
+    """
+    Plans a fuel-efficient powered descent for the "land" SAS mode: the
+    rocket coasts with the engine off for as long as possible, then burns
+    retrograde (a gravity turn, which stops the horizontal and the vertical
+    motion together) so that the lowest point of its hull touches down at
+    TOUCHDOWN_SPEED. The engine burns until the hull touches the ground, since a single frame of
+    free fall adds more speed than that. If the burn stops the rocket above
+    the ground, or it bounces off the ground, it descends from there at a
+    constant rate, it does not coast again once it burned near the ground.
+    The engine is the only way to turn the rocket, so before it coasts, the
+    rocket is turned retrograde with the engine at MIN_THRUST (unless it
+    rests on the ground).
+    Plans are found by shooting: the flight is simulated with a point-mass
+    model (gravity, drag in the atmosphere, fuel consumption and the thrust
+    ramp allowed by the engine's MAX_THRUST_CHANGE), and the ignition time
+    or, once burning, the thrust is solved for by bisection, warm-started
+    from the previous plan. Plans are recomputed at a bounded rate,
+    in between the controls follow the last plan.
+    """
+
+    DT = 0.02  # integration time step of the burn, in seconds
+    COAST_DT = 0.05  # integration time step of the coast, in seconds
+    HORIZON = 120  # longest simulated coast, in seconds
+    REPLAN_INTERVAL = 0.1  # time between plans, in seconds
+    # while the ignition is far away, plans are made less often: at a
+    # fraction of the time to ignition (up to MAX_REPLAN_INTERVAL)
+    MAX_REPLAN_INTERVAL = 1  # in seconds
+    REPLAN_FRACTION = 0.25
+    BURN_THROTTLE = 0.9  # throttle of the planned burn (margin for errors)
+    TOUCHDOWN_SPEED = 3  # planned speed at touchdown, in m/s
+    # tolerated error of the planned touchdown speed, in m/s (the touchdown
+    # may be slower than planned, but not faster)
+    TOLERANCE = 0.5
+    MAX_ITERATIONS = 16  # largest number of simulations per solve
+    STOP_SPEED = 0.5  # speed at which the burn has stopped the rocket, in m/s
+    # descent: when the burn has slowed the rocket down to TERMINAL_SPEED
+    # above the ground, its descent rate is controlled to TOUCHDOWN_SPEED
+    # (with a gain in 1/s)
+    TERMINAL_SPEED = 10  # in m/s
+    DESCENT_GAIN = 20  # in 1/s
+    # the rocket has touched down, when its hull is less than CONTACT above
+    # the ground (in m), the engine burns until then, a rocket that moves
+    # up less than BOUNCE above the ground has bounced off it
+    CONTACT = 0.02
+    BOUNCE = 1
+    # a burn that stops too high goes back to coasting only more than
+    # RECOAST_HEIGHT above the ground (in m), below, the rocket descends
+    RECOAST_HEIGHT = 100
+    # the rocket is aligned for the coast, when its tail points within
+    # ALIGN_ANGLE (in rad) of its velocity and it turns slower than
+    # ALIGN_SPIN (in rad/s)
+    ALIGN_ANGLE = 0.1
+    ALIGN_SPIN = 1
+    # during the burn, the tail points along the velocity plus VERTICAL_BIAS
+    # seconds of gravity, retrograde at high speeds, but upright near the
+    # ground, where the direction of a slow velocity is unstable. This leads
+    # the turn of the velocity towards the vertical, which the rocket
+    # follows with a lag (it turns at a limited rate), otherwise the burn
+    # overshoots and touches down with horizontal speed.
+    VERTICAL_BIAS = 0.8  # in s
+
+    def __init__(self, rocket):
+        self.rocket = rocket
+        # statistics: number of plans and of simulations
+        self.plans = 0
+        self.simulations = 0
+        self.reset()
+
+    # forget the current plan
+    def reset(self):
+        # "coast", "burn", "descent" or "landed"
+        self.phase = "coast"
+        self.ignition_time = None
+        self.thrust = None  # commanded thrust
+        self.t_plan = None  # time of the last plan
+        self.t_update = None  # time of the last update
+
+    # get the state of the planner (see set_state)
+    def get_state(self):
+        return (self.phase, self.ignition_time, self.thrust, self.t_plan,
+                self.t_update)
+
+    # restore a state captured with get_state
+    def set_state(self, state):
+        (self.phase, self.ignition_time, self.thrust, self.t_plan,
+         self.t_update) = state
+
+    # height of the rocket's origin when it stands on the ground at x
+    def touchdown_height(self, x):
+        return self.rocket.terrain.height(x) - self.rocket.engine_pos.y
+
+    # height of the lowest point of the rocket's hull above the ground
+    # under it, a tilted rocket touches down with a corner before its
+    # engine does
+    def clearance(self):
+        rocket = self.rocket
+        bbs = [shape.bb for shape in rocket.shapes]
+        left = min(bb.left for bb in bbs)
+        right = max(bb.right for bb in bbs)
+        terrain = rocket.terrain
+        ground = max(terrain.height(left), terrain.height(right),
+                     terrain.height((left + right) / 2))
+        return min(bb.bottom for bb in bbs) - ground
+
+    # the physical constants of the model
+    def setup_model(self, game):
+        rocket = self.rocket
+        engine = rocket.engine
+        self.gravity = -rocket.space.gravity[1]
+        self.atmosphere = rocket.atmosphere
+        # drag of the rocket, aligned with its velocity (see Rocket.drag_force)
+        self.drag = 3e1 * rocket.drag_coeff * rocket.span**2
+        self.fuel_consumption = engine.FUEL_CONSUMPTION
+        self.min_thrust = engine.MIN_THRUST
+        self.max_thrust = engine.MAX_THRUST
+        self.burn_thrust = self.BURN_THROTTLE * engine.MAX_THRUST
+        # the thrust changes by MAX_THRUST_CHANGE per frame
+        self.thrust_rate = engine.MAX_THRUST_CHANGE * game.FPS
+        # the ground under the model's rocket (see target_height)
+        self.terrain = rocket.terrain
+        self.engine_y = rocket.engine_pos.y
+
+    # a step of the point-mass model from a state (x, y, vx, vy, mass,
+    # thrust), with the engine off (command None) or burning retrograde,
+    # the thrust approaching the commanded thrust
+    def step(self, state, command, dt):
+        x, y, vx, vy, m, thrust = state
+        atmosphere = self.atmosphere
+        wind = atmosphere.wind(y)
+        air_vx = vx - wind
+        k = self.drag * atmosphere.density(y) * math.hypot(air_vx, vy) / m
+        ax = -k * air_vx
+        ay = -k * vy - self.gravity
+        change = self.thrust_rate * dt
+        if command is not None:
+            thrust = min(max(command, thrust - change), thrust + change)
+            speed = math.hypot(vx, vy)
+            a = thrust / m
+            if speed > 0:
+                ax -= a * vx / speed
+                ay -= a * vy / speed
+            else:
+                ay += a
+            m -= thrust * self.fuel_consumption * dt
+        else:
+            # the thrust is set up for the burn while coasting
+            thrust = min(max(self.burn_thrust, thrust - change),
+                         thrust + change)
+        # exact for a constant acceleration, the physics steps of the game
+        # are much shorter than those of the model
+        x += (vx + 0.5 * ax * dt) * dt
+        y += (vy + 0.5 * ay * dt) * dt
+        return x, y, vx + ax * dt, vy + ay * dt, m, thrust
+
+    # height of the model's origin when it stands on the ground at x
+    def target_height(self, x):
+        return self.terrain.height(x) - self.engine_y
+
+    # simulate the coast, returns the states at every COAST_DT until the
+    # rocket reaches the ground
+    def coast(self, state):
+        states = [state]
+        for _ in range(int(self.HORIZON / self.COAST_DT)):
+            state = self.step(state, None, self.COAST_DT)
+            if state[1] <= self.target_height(state[0]):
+                break
+            states.append(state)
+        self.simulations += 1
+        return states
+
+    # simulate a burn at a commanded thrust, returns by how much the speed
+    # at touchdown is below TOUCHDOWN_SPEED, where stopping above the ground
+    # counts as a touchdown speed of minus the height (so that the result
+    # grows steadily with the thrust)
+    def burn(self, state, command):
+        self.simulations += 1
+        for _ in range(int(self.HORIZON / self.DT)):
+            x, y, vx, vy, m, thrust = state
+            speed = math.hypot(vx, vy)
+            target_height = self.target_height(x)
+            if y <= target_height:
+                return self.TOUCHDOWN_SPEED - speed
+            if vy >= 0 or speed < self.STOP_SPEED:
+                return self.TOUCHDOWN_SPEED + y - target_height
+            state = self.step(state, command, self.DT)
+        return self.TOUCHDOWN_SPEED + state[1] - self.target_height(state[0])
+
+    # the last coast state at which the burn can start (its index, or -1
+    # if it is too late already), searched from the index guess on
+    def solve_ignition(self, states, guess):
+        def safe(i):
+            return self.burn(states[i], self.burn_thrust) >= 0
+
+        # bracket the index: safe(lo) and not safe(hi)
+        n = len(states)
+        guess = min(max(guess, 0), n - 1)
+        step = 1
+        if safe(guess):
+            lo, hi = guess, guess + step
+            while hi < n and safe(hi):
+                lo, step = hi, step * 2
+                hi = lo + step
+            hi = min(hi, n)
+        else:
+            lo, hi = guess - step, guess
+            while lo >= 0 and not safe(lo):
+                hi, step = lo, step * 2
+                lo = hi - step
+            if lo < 0:
+                if hi == 0 or not safe(0):
+                    return -1
+                lo = 0
+        # bisection
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if safe(mid):
+                lo = mid
+            else:
+                hi = mid
+        return lo
+
+    # the thrust for which the burn touches down at TOUCHDOWN_SPEED (or
+    # slower, within TOLERANCE), searched from the thrust guess on, returns
+    # the thrust and the result of the burn (see burn)
+    def solve_thrust(self, state, guess):
+        # the burn at lo touches down too fast, the one at hi does not
+        lo = hi = None
+        thrust = min(max(guess, self.min_thrust), self.max_thrust)
+        step = 0.02 * self.max_thrust
+        for _ in range(self.MAX_ITERATIONS):
+            f = self.burn(state, thrust)
+            if 0 <= f < self.TOLERANCE:
+                return thrust, f
+            if f < 0:
+                lo = thrust
+                if hi is None:
+                    # bracket in growing steps from the guess on
+                    if thrust >= self.max_thrust:
+                        break
+                    thrust = min(thrust + step, self.max_thrust)
+                    step *= 2
+                    continue
+            else:
+                hi, f_hi = thrust, f
+                if lo is None:
+                    if thrust <= self.min_thrust:
+                        break
+                    thrust = max(thrust - step, self.min_thrust)
+                    step *= 2
+                    continue
+            # bisection
+            if hi - lo < 1e-3 * self.max_thrust:
+                break
+            thrust = (lo + hi) / 2
+        # the thrust on the safe side, if there is one
+        if hi is not None:
+            return hi, f_hi
+        return thrust, f
+
+    # make a new plan from the state of the rocket
+    def plan(self, game, state):
+        self.plans += 1
+        self.t_plan = game.time
+        self.setup_model(game)
+        if self.phase == "coast":
+            states = self.coast(state)
+            guess = 0
+            if self.ignition_time is not None:
+                guess = round((self.ignition_time - game.time) / self.COAST_DT)
+            i = self.solve_ignition(states, guess)
+            if i > 0:
+                self.ignition_time = game.time + i * self.COAST_DT
+                self.thrust = self.burn_thrust
+                return
+            self.phase = "burn"
+            self.ignition_time = game.time
+            self.thrust = self.burn_thrust
+        # burning: solve for the thrust, warm-started from the last one,
+        # if even the lowest thrust stops too high, go back to coasting,
+        # or near the ground, descend
+        self.thrust, f = self.solve_thrust(state, self.thrust)
+        if self.thrust <= self.min_thrust and f > 10 * self.TOLERANCE:
+            if self.clearance() > self.RECOAST_HEIGHT:
+                self.phase = "coast"
+                self.ignition_time = None
+            else:
+                self.phase = "descent"
+
+    # whether the tail of the rocket points along its velocity and
+    # the rocket does not turn, or it (nearly) stands still
+    def aligned(self, telemetry):
+        velocity = telemetry["velocity"]
+        angle = telemetry["angle"]
+        speed = velocity.length
+        if speed < self.STOP_SPEED:
+            return True
+        tail = math.sin(angle) * velocity.x - math.cos(angle) * velocity.y
+        return tail > speed * math.cos(self.ALIGN_ANGLE) and \
+            abs(telemetry["angular_velocity"]) < self.ALIGN_SPIN
+
+    # the time until the next plan is due
+    def replan_interval(self, time):
+        if self.phase == "coast" and self.ignition_time is not None:
+            return min(max(self.REPLAN_INTERVAL, self.REPLAN_FRACTION *
+                           (self.ignition_time - time)),
+                       self.MAX_REPLAN_INTERVAL)
+        return self.REPLAN_INTERVAL
+
+    # update the plan from the rocket's telemetry and get the controls:
+    # whether the engine burns, its thrust and the target direction of the
+    # rocket (the direction in which its tail points)
+    def update(self, game, telemetry):
+        time = game.time
+        rocket = self.rocket
+        # start over, if the planner was not used in the last frame
+        if self.t_update is None or time > self.t_update + 1.5 / game.FPS \
+                or self.phase == "landed":
+            self.reset()
+        self.t_update = time
+        position = telemetry["position"]
+        velocity = telemetry["velocity"]
+        mass = telemetry["mass"]
+        gravity = -rocket.space.gravity[1]
+        # the model touches down with its origin at touchdown_height, the
+        # rocket with the lowest point of its hull
+        height = self.clearance()
+
+        # touchdown (or a bounce off the ground), a rocket that rests on
+        # the ground has landed already
+        on_ground = height < self.CONTACT or \
+            velocity.y > 0 and height < self.BOUNCE
+        if on_ground and (self.phase != "coast" or
+                          velocity.length < self.STOP_SPEED):
+            self.phase = "landed"
+            return False, rocket.engine.MIN_THRUST, velocity
+        # descent at a constant rate, when stopped or moving up above the
+        # ground
+        if self.phase == "burn" and (velocity.length < self.TERMINAL_SPEED
+                                     or velocity.y > 0):
+            self.phase = "descent"
+        if self.phase == "descent":
+            thrust = mass * (gravity + self.DESCENT_GAIN * (
+                -self.TOUCHDOWN_SPEED - velocity.y))
+            # the engine only burns if the thrust it can reach in this frame
+            # is closer to the wanted thrust than no thrust at all
+            engine = rocket.engine
+            reachable = min(max(thrust, engine.MIN_THRUST,
+                                engine.thrust - engine.MAX_THRUST_CHANGE),
+                            engine.thrust + engine.MAX_THRUST_CHANGE)
+            return reachable < 2 * thrust, thrust, velocity + (0, -gravity)
+
+        if self.t_plan is None or \
+                time >= self.t_plan + self.replan_interval(time):
+            state = (position.x, self.touchdown_height(position.x) + height,
+                     velocity.x, velocity.y, mass, rocket.engine.thrust)
+            self.plan(game, state)
+        if self.phase == "coast" and self.ignition_time is not None and \
+                time >= self.ignition_time:
+            self.phase = "burn"
+        if self.phase == "coast" and not self.aligned(telemetry):
+            return True, rocket.engine.MIN_THRUST, velocity
+        return self.phase == "burn", self.thrust, \
+            velocity + (0, -self.VERTICAL_BIAS * gravity)
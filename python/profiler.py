@@ -0,0 +1,152 @@
+import json
+import time
+from collections import deque
+from contextlib import nullcontext
+import pygame
+
+
+class Section():
+    """
+    A named, timed section of code, used as a context manager.
+    Keeps the durations of its most recent runs.
+    """
+
+    def __init__(self, name, window):
+        self.name = name
+        self.durations = deque(maxlen=window)  # in seconds
+        self.count = 0
+        self.t_start = 0
+
+    def __enter__(self):
+        self.t_start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.durations.append(time.perf_counter() - self.t_start)
+        self.count += 1
+        return False
+
+
+class Profiler():
+    """
+    Times named sections of the game loop, e.g.,
+        with game.profiler.section("physics.step"):
+            ...
+    and keeps rolling statistics (mean and percentiles) over the most recent
+    runs of each section. When disabled, section() returns a shared no-op
+    context, so the instrumentation costs next to nothing.
+    The statistics can be shown as an on-screen overlay or dumped as a report.
+    """
+
+    WINDOW = 1000  # number of recent runs per section in the statistics
+    PERCENTILES = (50, 95, 99)
+    OVERLAY_INTERVAL = 0.5  # time between overlay updates, in s
+    FONT_SIZE = 20
+    LINE_HEIGHT = 16  # in px
+
+    def __init__(self, enabled=False, window=WINDOW):
+        self.enabled = enabled
+        # profiling asked for on its own (e.g., with --profile), which keeps
+        # running while the overlay is hidden
+        self.requested = enabled
+        self.window = window
+        self.sections = {}
+        self.null_section = nullcontext()
+        # on-screen overlay (rendered at most every OVERLAY_INTERVAL)
+        self.show_overlay = False
+        self.font = None
+        self.overlay = None
+        self.t_overlay = 0
+
+    # get the context manager that times a section
+    def section(self, name):
+        if not self.enabled:
+            return self.null_section
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = Section(name, self.window)
+        return section
+
+    # profile until the end, whether the overlay is shown or not
+    def start(self):
+        self.requested = self.enabled = True
+
+    # show or hide the overlay, profiling is enabled while it is shown
+    def toggle_overlay(self):
+        self.show_overlay = not self.show_overlay
+        self.enabled = self.requested or self.show_overlay
+        self.overlay = None
+
+    # forget all measurements
+    def reset(self):
+        self.sections = {}
+
+    # statistics of a section (durations in ms)
+    def stats(self, name):
+        section = self.sections[name]
+        durations = sorted(section.durations)
+        n = len(durations)
+        stats = {
+            "count": section.count,
+            "mean": sum(durations) / n * 1e3,
+        }
+        for p in self.PERCENTILES:
+            stats[f"p{p}"] = durations[min(n * p // 100, n - 1)] * 1e3
+        stats["max"] = durations[-1] * 1e3
+        return stats
+
+    # statistics of all sections, sorted by name
+    def report(self):
+        return {name: self.stats(name) for name in sorted(self.sections)
+                if self.sections[name].durations}
+
+    # the report as rows of cells (with a header row)
+    def report_rows(self):
+        columns = ["mean"] + [f"p{p}" for p in self.PERCENTILES] + ["max"]
+        rows = [["section (ms)", "count"] + columns]
+        for name, stats in self.report().items():
+            rows.append([name, str(stats["count"])] +
+                        [f"{stats[c]:.3f}" for c in columns])
+        return rows
+
+    # the report as lines of text
+    def report_lines(self):
+        return [f"{row[0]:<20}" + "".join(f"{cell:>9}" for cell in row[1:])
+                for row in self.report_rows()]
+
+    # print the report, or save it as JSON if a filename is given
+    def dump(self, filename=None):
+        if filename is None:
+            print("\n".join(self.report_lines()))
+            return
+        with open(filename, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    # draw the overlay on the game's screen (top right corner)
+    def draw(self, game):
+        if not self.show_overlay:
+            return
+        t = time.perf_counter()
+        if self.overlay is None or t > self.t_overlay + self.OVERLAY_INTERVAL:
+            self.t_overlay = t
+            if self.font is None:
+                self.font = pygame.font.Font(None, self.FONT_SIZE)
+            # render the cells, the numbers right-aligned in their columns
+            rows = [[self.font.render(cell, True, pygame.Color("black"))
+                     for cell in row] for row in self.report_rows()]
+            widths = [max(row[i].get_width() for row in rows) + 10
+                      for i in range(len(rows[0]))]
+            self.overlay = pygame.Surface(
+                (sum(widths) + 10, len(rows) * self.LINE_HEIGHT + 10),
+                pygame.SRCALPHA)
+            self.overlay.fill((255, 255, 255, 200))
+            for i, row in enumerate(rows):
+                y = 5 + i * self.LINE_HEIGHT
+                self.overlay.blit(row[0], (5, y))
+                right = 5 + widths[0]
+                for width, surface in zip(widths[1:], row[1:]):
+                    right += width
+                    x = right - surface.get_width() - 10
+                    self.overlay.blit(surface, (x, y))
+        x = game.FRAME_WIDTH - self.overlay.get_width() - 5
+        game.screen.blit(self.overlay, (x, 5))
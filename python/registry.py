@@ -0,0 +1,119 @@
+import pymunk
+from objects import Object
+
+
+class ObjectRegistry():
+    """
+    The objects of a game, with constant-time insertion and removal and a
+    stable (insertion) iteration order. It keeps the pymunk Space in sync:
+    removed objects also leave the Space with their body, shape and
+    constraints. Objects may have several shapes (see Object.shapes).
+    Objects are grouped by type, and the objects that actually
+    implement the physics hooks update_forces / update_drag are kept in
+    separate groups, so that the physics only calls the hooks on those.
+    Passive dynamic objects with a drag area are grouped as well, so that
+    their drag can be applied in bulk. Objects added without hooks are in
+    none of these groups, their forces are applied by someone else (e.g.,
+    by a fleet.Fleet for all of its rockets at once).
+    """
+
+    def __init__(self, space):
+        self.space = space
+        # dicts are used as ordered sets
+        self.objects = {}
+        self.by_type = {}
+        self.forced = {}
+        self.dragged = {}
+        self.passive = {}
+        # the object that owns each dynamic body, and each shape
+        # of the static body
+        self.body_objects = {}
+        self.shape_objects = {}
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __contains__(self, obj):
+        return obj in self.objects
+
+    # the object that owns a shape (or None)
+    def owner(self, shape):
+        obj = self.body_objects.get(shape.body)
+        if obj is None:
+            obj = self.shape_objects.get(shape)
+        return obj
+
+    # check whether an object implements the update_forces hook
+    @staticmethod
+    def has_forces(obj):
+        return type(obj).update_forces is not Object.update_forces
+
+    # check whether an object implements the update_drag hook
+    @staticmethod
+    def has_drag(obj):
+        return type(obj).update_drag is not Object.update_drag
+
+    # add an object (and its body and shape to the Space, if not yet there),
+    # hooks tells whether the physics applies its forces and drag
+    def add(self, obj, hooks=True):
+        if obj in self.objects:
+            return obj
+        self.objects[obj] = None
+        self.by_type.setdefault(type(obj), {})[obj] = None
+        body = obj.body
+        if hooks:
+            if self.has_forces(obj):
+                self.forced[obj] = None
+            if self.has_drag(obj):
+                self.dragged[obj] = None
+            elif obj.drag_area and body.body_type == pymunk.Body.DYNAMIC:
+                self.passive[obj] = None
+        if body.body_type == pymunk.Body.STATIC:
+            for shape in obj.shapes:
+                self.shape_objects[shape] = obj
+        else:
+            self.body_objects[body] = obj
+        if body.space is None:
+            self.space.add(body)
+        for shape in obj.shapes:
+            if shape.space is None:
+                self.space.add(shape)
+        return obj
+
+    # remove an object and its body, shape and constraints from the Space
+    def remove(self, obj):
+        if obj not in self.objects:
+            return
+        del self.objects[obj]
+        del self.by_type[type(obj)][obj]
+        self.forced.pop(obj, None)
+        self.dragged.pop(obj, None)
+        self.passive.pop(obj, None)
+        body = obj.body
+        for shape in obj.shapes:
+            self.shape_objects.pop(shape, None)
+            if shape.space is self.space:
+                self.space.remove(shape)
+        if body.body_type == pymunk.Body.STATIC:
+            # a static body of its own (e.g., of an objects.GroundChunk)
+            # leaves with the object, the Space's static body stays
+            if body is not self.space.static_body and \
+                    body.space is self.space:
+                self.space.remove(body)
+            return
+        del self.body_objects[body]
+        if body.space is self.space:
+            # (constraints know no Space, so look them up in the Space)
+            in_space = self.space.constraints
+            for constraint in body.constraints:
+                if constraint in in_space:
+                    self.space.remove(constraint)
+            self.space.remove(body)
+
+    # all objects of a given type (including subclasses)
+    def of_type(self, cls):
+        return [obj for t, objects in self.by_type.items()
+                if issubclass(t, cls) for obj in objects]
@@ -0,0 +1,279 @@
+#!/usr/bin/python3
+
+import os
+import zlib
+import pickle
+import struct
+import argparse
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import pygame  # noqa: E402
+from game import RocketGame, KeyState  # noqa: E402
+from objects import Ball  # noqa: E402
+from tests import ALL_TESTS  # noqa: E402
+
+# Replay logs are binary files: a header with the seed and time step,
+# followed by records that start with a one-byte tag:
+#   b"F": the input of a frame (only written when it differs from "no events,
+#         same keys as before"): frame, mask of pressed keys, list of events
+#   b"S": a snapshot of the game state before the input of a frame
+#   b"E": the end of the recording, with the total number of frames
+MAGIC = b"PYRL"
+VERSION = 1
+HEADER = struct.Struct("<4sBQdd")  # magic, version, seed, DT, FPS
+FRAME = struct.Struct("<IBB")  # frame, key mask, number of events
+SNAPSHOT = struct.Struct("<II")  # frame, size of the compressed state
+END = struct.Struct("<I")  # total number of frames
+
+# the keys whose pressed state is recorded (one bit each)
+RECORDED_KEYS = [pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT]
+
+# the events that are recorded: (type, code, struct of the attributes)
+QUIT, KEYDOWN, MOUSEBUTTONDOWN, VIDEORESIZE = range(4)
+EVENTS = {
+    QUIT: (pygame.QUIT, struct.Struct("<"), ()),
+    KEYDOWN: (pygame.KEYDOWN, struct.Struct("<i"), ("key",)),
+    MOUSEBUTTONDOWN: (pygame.MOUSEBUTTONDOWN, struct.Struct("<Bii"),
+                      ("button", "x", "y")),
+    VIDEORESIZE: (pygame.VIDEORESIZE, struct.Struct("<II"), ("w", "h")),
+}
+EVENT_CODES = {event_type: code for code, (event_type, _, _) in EVENTS.items()}
+
+
+# capture the state of a game as plain (picklable) data, unlike
+# RocketGame.snapshot this does not refer to the objects of the game
+def capture_state(game):
+    test = None
+    if game.test is not None:
+        t = game.test
+        test = (ALL_TESTS.index(t),
+                ALL_TESTS.index(t.next_test) if t.next_test else None,
+                t.get_state())
+    return {
+        "time": game.time,
+        "frame": game.frame,
+        "physics_steps": game.physics_steps,
+        "run_physics": game.run_physics,
+        "frame_size": (game.FRAME_WIDTH, game.FRAME_HEIGHT),
+        "adaptive_dt": game.adaptive_dt,
+        "origin": tuple(game.origin),
+        "rebases": game.rebases,
+        "random": game.random.getstate(),
+        "rocket": game.rocket.get_state(parts=False),
+        "balls": [(ball.shape.radius, ball.body.mass, ball.get_state())
+                  for ball in game.objects.of_type(Ball)],
+        "test": test,
+    }
+
+
+# restore the state of a game captured with capture_state
+def restore_state(game, state):
+    game.time = state["time"]
+    game.frame = state["frame"]
+    game.physics_steps = state["physics_steps"]
+    game.run_physics = state["run_physics"]
+    game.FRAME_WIDTH, game.FRAME_HEIGHT = state["frame_size"]
+    game.adaptive_dt = state["adaptive_dt"]
+    game.accelerations = {}
+    game.random.setstate(state["random"])
+    # the positions of the objects are relative to the origin
+    game.move_origin(state.get("origin", (0, 0)))
+    game.rebases = state.get("rebases", 0)
+    game.rocket.set_state(state["rocket"])
+    # obstacles
+    for ball in game.objects.of_type(Ball):
+        game.remove_object(ball)
+    for radius, mass, ball_state in state["balls"]:
+        ball = game.add_object(Ball(game.space, 0, 0, radius, mass))
+        ball.set_state(ball_state)
+    # test
+    game.test = None
+    if state["test"] is not None:
+        index, next_index, test_state = state["test"]
+        test = ALL_TESTS[index]
+        test.game = game
+        test.next_test = None if next_index is None else ALL_TESTS[next_index]
+        test.set_state(test_state)
+        game.test = test
+
+
+class ReplayRecorder():
+    """
+    Records the input of a game frame by frame into a replay log, together
+    with the seed of the game and periodic snapshots of its state.
+    Attach it with game.replay = ReplayRecorder(filename, game).
+    """
+
+    SNAPSHOT_INTERVAL = 10  # simulated seconds between snapshots
+
+    def __init__(self, filename, game):
+        self.file = open(filename, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, game.seed, game.DT,
+                                    game.FPS))
+        self.key_mask = 0
+        self.t_snapshot = None
+        self.frames = 0
+
+    # record the input of a frame (and a snapshot, when due)
+    def process_input(self, game, events, pressed_keys):
+        if self.t_snapshot is None or \
+                game.time >= self.t_snapshot + self.SNAPSHOT_INTERVAL:
+            self.snapshot(game)
+        key_mask = 0
+        for i, key in enumerate(RECORDED_KEYS):
+            if pressed_keys[key]:
+                key_mask |= 1 << i
+        recorded = [e for e in events if e.type in EVENT_CODES]
+        if recorded or key_mask != self.key_mask:
+            self.file.write(
+                b"F" + FRAME.pack(game.frame, key_mask, len(recorded)))
+            for event in recorded:
+                self.file.write(encode_event(event))
+        self.key_mask = key_mask
+        self.frames = game.frame + 1
+        return events, pressed_keys
+
+    # write a snapshot of the game state
+    def snapshot(self, game):
+        self.t_snapshot = game.time
+        data = zlib.compress(pickle.dumps(capture_state(game)))
+        self.file.write(b"S" + SNAPSHOT.pack(game.frame, len(data)) + data)
+
+    # finish the recording
+    def close(self):
+        self.file.write(b"E" + END.pack(self.frames))
+        self.file.close()
+
+
+# encode an event as bytes
+def encode_event(event):
+    code = EVENT_CODES[event.type]
+    _, fmt, names = EVENTS[code]
+    if code == MOUSEBUTTONDOWN:
+        values = event.button, *event.pos
+    else:
+        values = [getattr(event, name) for name in names]
+    return struct.pack("<B", code) + fmt.pack(*values)
+
+
+class ReplayPlayer():
+    """
+    Plays back a replay log in a headless game, as fast as possible.
+    The recorded input is fed to the game frame by frame, and seek() jumps
+    to any frame by restoring the last snapshot before it, so that only the
+    remaining frames need to be simulated.
+    Note that pymunk's contact caches are not part of the snapshots, so after
+    a jump, bodies in contact may deviate slightly from the original run.
+    """
+
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            data = f.read()
+        magic, version, self.seed, self.dt, self.fps = \
+            HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{filename} is not a replay log")
+        # recorded input {frame: (key mask, events)} and snapshots
+        self.inputs = {}
+        self.snapshots = []  # list of (frame, compressed state)
+        self.frames = None
+        pos = HEADER.size
+        while pos < len(data):
+            tag = data[pos:pos+1]
+            pos += 1
+            if tag == b"F":
+                frame, key_mask, n_events = FRAME.unpack_from(data, pos)
+                pos += FRAME.size
+                events = []
+                for _ in range(n_events):
+                    code = data[pos]
+                    event_type, fmt, names = EVENTS[code]
+                    values = fmt.unpack_from(data, pos + 1)
+                    pos += 1 + fmt.size
+                    attributes = dict(zip(names, values))
+                    if code == MOUSEBUTTONDOWN:
+                        attributes = {"button": values[0],
+                                      "pos": (values[1], values[2])}
+                    events.append(pygame.event.Event(event_type, attributes))
+                self.inputs[frame] = (key_mask, events)
+            elif tag == b"S":
+                frame, size = SNAPSHOT.unpack_from(data, pos)
+                pos += SNAPSHOT.size
+                self.snapshots.append((frame, data[pos:pos+size]))
+                pos += size
+            elif tag == b"E":
+                self.frames, = END.unpack_from(data, pos)
+                pos += END.size
+            else:
+                raise ValueError(f"corrupt replay log {filename}")
+        if self.frames is None:
+            # the recording was not closed, e.g., after a crash
+            self.frames = max(list(self.inputs) + [0]) + 1
+        # the key mask that is active at each recorded frame
+        self.key_mask = 0
+        self.game = self.new_game()
+
+    # create a new headless game for the playback
+    def new_game(self):
+        game = RocketGame(headless=True, seed=self.seed)
+        game.DT = self.dt
+        game.FPS = self.fps
+        game.replay = self
+        return game
+
+    # feed the recorded input of the current frame to the game
+    def process_input(self, game, events, pressed_keys):
+        events = []
+        if game.frame in self.inputs:
+            self.key_mask, events = self.inputs[game.frame]
+        keys = [key for i, key in enumerate(RECORDED_KEYS)
+                if self.key_mask & (1 << i)]
+        return events, KeyState(keys)
+
+    # the key mask that is active before a given frame
+    def key_mask_before(self, frame):
+        recorded = [f for f in self.inputs if f < frame]
+        return self.inputs[max(recorded)][0] if recorded else 0
+
+    # jump to a given frame, using the last snapshot before it
+    def seek(self, frame):
+        game = self.game
+        if frame < game.frame:
+            self.game = game = self.new_game()
+        snapshots = [s for s in self.snapshots if game.frame < s[0] <= frame]
+        if snapshots:
+            snapshot_frame, data = snapshots[-1]
+            restore_state(game, pickle.loads(zlib.decompress(data)))
+            self.key_mask = self.key_mask_before(snapshot_frame)
+        self.play(frame)
+        return game
+
+    # play until a given frame (or the end of the recording)
+    def play(self, frame=None):
+        if frame is None:
+            frame = self.frames
+        game = self.game
+        while game.running and game.frame < frame:
+            game.handle_controls()
+            game.update_frame_physics()
+        return game
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Play back a replay log headless, as fast as possible.")
+    parser.add_argument("log", help="replay log recorded with main.py --record")
+    parser.add_argument("--time", type=float, default=None,
+                        help="jump to this simulated time (default: the end)")
+    args = parser.parse_args()
+
+    player = ReplayPlayer(args.log)
+    if args.time is None:
+        game = player.play()
+    else:
+        game = player.seek(int(args.time * player.fps))
+    rocket = game.rocket
+    print(f"frame: {game.frame}/{player.frames}, time: {game.time:.3f}s")
+    print(f"rocket position: {tuple(rocket.body.position)}")
+    print(f"rocket velocity: {tuple(rocket.body.velocity)}")
+    print(f"rocket angle: {rocket.body.angle}")
+    print(f"SAS: {rocket.pilot.sas_mode}, fuel used: {rocket.stats['fuel_used']}")
@@ -2,33 +2,59 @@ import math
 import random
 import pygame
 import pymunk
-from objects import Poly
+from pymunk import Vec2d
+from objects import Object
 from engine import Engine
 from pilot import Autopilot
+from rocket_components import FuelTank, NoseCone, Fins, stack
 
 
-class Rocket(Poly):
+class Rocket(Object):
+    """
+    A rocket assembled from parts (see rocket_components), which are shapes
+    on one compound body. By default, the rocket is a cylindrical fuel tank
+    of width w and height h with a nose cone on top.
+    The mass, center of gravity and moment of inertia of the body are kept
+    as sums over the parts and updated incrementally when parts are added,
+    removed or change their mass, e.g., when the engine burns the fuel of
+    the fuel tanks. The dimensions of the rocket are only recomputed when
+    parts are added or removed.
+    """
 
-    def __init__(self, space, x, y, w=15, h=150, mass=300e3):
-        points = [(-w/2, -h/2), (w/2, -h/2),
-                  (w/2, h/2), (0, h/1.5), (-w/2, h/2)]
-        super().__init__(space, x, y, points, mass)
+    # distance by which the center of gravity of the parts may drift from
+    # that of the body, before the body's is moved (which is slow)
+    COG_TOLERANCE = 1e-2
+
+    def __init__(self, space, x, y, w=15, h=150, mass=300e3, parts=None):
+        super().__init__()
         self.space = space
-        self.mass = mass
         self.color = 112, 122, 255
-        self.shape.friction = 0.5
-
-        # rocket dimensions
-        self.w = w
-        self.h = h
 
         # drag coefficient
         self.drag_coeff = 1e-5
         self.airbrakes_enabled = False
 
-        # the rocket engine
+        # the rocket engine, at the bottom of the main body
         self.engine = Engine()
-        self.engine_pos = pymunk.Vec2d(0, -h/2)  # position of the engine
+        self.engine_pos = Vec2d(0, -h/2)  # position of the engine
+
+        # the compound body, its mass properties are set by the parts
+        self.body = pymunk.Body(mass, 1)
+        self.body.position = x, y
+        space.add(self.body)
+        # sums over the parts (as floats, they change at every step while
+        # the engine burns): mass, first moment of mass (mass * center)
+        # and moment of inertia about the origin of the body
+        self._mass = self._mass_x = self._mass_y = self._moment = 0
+        self._cog = (0, 0)  # the center of gravity of the body
+        # the parts (a dict is used as an ordered set) and the fuel tanks
+        # among them, which are drained in order
+        self.parts = {}
+        self.tanks = []
+        if parts is None:
+            parts = self.default_parts(w, h, mass)
+        for part in parts:
+            self.add_part(part)
 
         # the pilot / autopilot system
         self.pilot = Autopilot(self)
@@ -36,30 +62,167 @@ class Rocket(Poly):
         # statistics
         self.stats = {"fuel_used": 0}
 
+        # random number generator for the sensor noise
+        self.random = random.Random()
+
+    # the parts of the default rocket: a fuel tank with a nose cone
+    # (of uniform density)
+    @staticmethod
+    def default_parts(w, h, mass):
+        return stack([FuelTank(w, h, mass * 12 / 13),
+                      NoseCone(w, h / 6, mass / 13)])
+
+    # the shapes of all parts
+    @property
+    def shapes(self):
+        return [part.shape for part in self.parts]
+
+    # the current mass of the rocket
+    @property
+    def mass(self):
+        return self.body.mass
+
+    # the fuel left in the tanks
+    @property
+    def fuel(self):
+        return sum(tank.fuel for tank in self.tanks)
+
+    # add a part to the rocket, as a new shape on its body
+    def add_part(self, part):
+        part.attach(self.body)
+        self.parts[part] = None
+        if isinstance(part, FuelTank):
+            self.tanks.append(part)
+        self.shape = next(iter(self.parts)).shape  # the main shape
+        if self.body.space is not None:
+            self.body.space.add(part.shape)
+        self.add_mass(part, part.mass, exact=True)
+        self.update_dimensions()
+
+    # remove a part from the rocket (and its shape from the Space)
+    def remove_part(self, part):
+        del self.parts[part]
+        if part in self.tanks:
+            self.tanks.remove(part)
+        self.shape = next(iter(self.parts)).shape if self.parts else None
+        if part.shape.space is not None:
+            part.shape.space.remove(part.shape)
+        part.body = part.shape = None
+        if self.parts:
+            self.add_mass(part, -part.mass, exact=True)
+            self.update_dimensions()
+        else:
+            # start over from exact zero sums
+            self._mass = self._mass_x = self._mass_y = self._moment = 0
+
+    # remove a part and turn it into a free object that moves on with the
+    # rocket's velocity (e.g., a burned off booster), add it to the game with
+    # game.add_object
+    def detach_part(self, part):
+        body = self.body
+        self.remove_part(part)
+        part.body = body
+        part.detach()
+        return part
+
+    # change the mass of the rocket by the mass dm of a part, at the part's
+    # center of gravity and with its moment of inertia per mass
+    # (see update_mass_properties for exact)
+    def add_mass(self, part, dm, exact=False):
+        cx, cy = part.center
+        self._mass += dm
+        self._mass_x += cx * dm
+        self._mass_y += cy * dm
+        self._moment += (part.moment_per_mass + cx * cx + cy * cy) * dm
+        self.update_mass_properties(exact)
+
+    # burn an amount of fuel (in kg) from the tanks, returns the amount
+    # that was left to burn
+    def consume_fuel(self, amount):
+        burned = 0
+        for tank in self.tanks:
+            if burned >= amount:
+                break
+            dm = tank.drain(amount - burned)
+            if dm > 0:
+                self.add_mass(tank, -dm)
+                burned += dm
+        return burned
+
+    # fill up all fuel tanks
+    def refuel(self):
+        for tank in self.tanks:
+            dm = tank.fill()
+            if dm > 0:
+                self.add_mass(tank, dm)
+
+    # set the mass, center of gravity and moment of inertia of the body
+    # from the sums over the parts, unless exact is True, small changes of
+    # the center of gravity (below COG_TOLERANCE) are left out and the
+    # moment of inertia is taken about the body's center of gravity
+    def update_mass_properties(self, exact=False):
+        body = self.body
+        mass = self._mass
+        cog = cx, cy = self._mass_x / mass, self._mass_y / mass
+        px, py = self._cog
+        if cog != self._cog and (exact or abs(cx - px) + abs(cy - py) >
+                                 self.COG_TOLERANCE):
+            # keep the position and velocity of the body's origin
+            position = body.position
+            velocity = body.velocity_at_local_point(cog)
+            body.center_of_gravity = cog
+            body.position = position
+            body.velocity = velocity
+            self._cog = px, py = cog
+        body.mass = mass
+        body.moment = self._moment - \
+            2 * (px * self._mass_x + py * self._mass_y) + \
+            mass * (px * px + py * py)
+
+    # update the dimensions of the rocket from the bounds of its main body,
+    # the engine sits at the bottom of it, and the extent of all parts
+    # across (span) and along (length) its axis, for the drag
+    def update_dimensions(self):
+        bounds = [part.bounds() for part in self.parts if part.BODY_PART]
+        if not bounds:
+            return
+        left = min(b[0] for b in bounds)
+        bottom = min(b[1] for b in bounds)
+        right = max(b[2] for b in bounds)
+        top = max(b[3] for b in bounds)
+        self.w = right - left
+        self.h = top - bottom
+        self.engine_pos = Vec2d((left + right) / 2, bottom)
+        bounds = [part.bounds() for part in self.parts]
+        self.span = max(b[2] for b in bounds) - min(b[0] for b in bounds)
+        self.length = max(b[3] for b in bounds) - min(b[1] for b in bounds)
+
+    # check whether the rocket has a part of a given type
+    def has_part(self, cls):
+        return any(isinstance(part, cls) for part in self.parts)
+
     # apply the physical forces to the rocket
-    def update_forces(self):
+    def update_forces(self, dt):
         angle = self.engine.angle
         thrust_x = self.engine.thrust * math.sin(angle)
         thrust_y = self.engine.thrust * math.cos(angle)
-        thrust_force = (thrust_x, thrust_y)
         if self.engine.ignited:
+            # the engine burns fuel in proportion to the impulse, with
+            # the thrust cut short when the tanks run dry
+            fuel = self.engine.thrust * self.engine.FUEL_CONSUMPTION * dt
+            burned = self.consume_fuel(fuel)
+            if burned <= 0:
+                return
+            thrust_force = (thrust_x * burned / fuel, thrust_y * burned / fuel)
             self.body.apply_force_at_local_point(
                 thrust_force, self.engine_pos)
-            self.stats["fuel_used"] += self.engine.thrust * \
-                self.engine.FUEL_CONSUMPTION
+            self.stats["fuel_used"] += burned
 
     # the aerodynamic drag
-    def update_drag(self):
-        # velocity
-        v = self.body.velocity
-        # orientation
-        rot = self.body.rotation_vector
-        # exposed area
-        A = abs(v.normalized().dot(rot))
-        A = A * self.h**2 + (1-A) * self.w**2
-        A *= self.drag_coeff
+    def update_drag(self, dt):
         # calculate and apply drag force
-        drag_force = super()._drag_formula(A, v, coeff=3e1)
+        drag_force = self.drag_force(
+            self.body.velocity, self.body.rotation_vector)
         # where is drag force applied?
         drag_fp = pymunk.Vec2d(0, -5*self.h)
         if self.airbrakes_enabled:
@@ -67,8 +230,21 @@ class Rocket(Poly):
             drag_force *= 1
         self.body.apply_force_at_local_point(
             drag_force.rotated(-self.body.angle), drag_fp)
-        # relax angular velocity
-        self.body.angular_velocity *= 0.999
+        # relax angular velocity (by 0.1% per millisecond)
+        self.body.angular_velocity *= 0.999 ** (dt / 1e-3)
+
+    # the aerodynamic drag force at a given velocity, orientation and
+    # height (by default, that of the rocket)
+    def drag_force(self, v, rot, height=None):
+        if height is None:
+            height = self.body.position.y
+        # exposed area of all parts, for the velocity relative to the air
+        wind = self.atmosphere.wind(height)
+        air_velocity = v - (wind, 0) if wind else v
+        A = abs(air_velocity.normalized().dot(rot))
+        A = A * self.length**2 + (1-A) * self.span**2
+        A *= self.drag_coeff
+        return super()._drag_formula(A, v, coeff=3e1, height=height)
 
     # get telemetry data, e.g., for autopilot
     def get_telemetry(self):
@@ -78,10 +254,56 @@ class Rocket(Poly):
         angle = (self.body.angle + math.pi) % (2 * math.pi) - math.pi
         data["angle"] = angle * self.noise()
         data["angular_velocity"] = self.body.angular_velocity * self.noise()
+        data["mass"] = self.mass
         return data
 
+    # get the state of the rocket, including engine, pilot, statistics and
+    # the fuel in the tanks, and (unless parts is False) the parts it
+    # consists of
+    def get_state(self, parts=True):
+        return (super().get_state(), self.engine.get_state(),
+                self.pilot.get_state(), self.airbrakes_enabled,
+                dict(self.stats), self.random.getstate(),
+                self.get_mass_state(), tuple(self.parts) if parts else None)
+
+    # restore a state captured with get_state
+    def set_state(self, state):
+        (body, engine, pilot, self.airbrakes_enabled, stats,
+         random_state, mass_state, parts) = state
+        if parts is not None and parts != tuple(self.parts):
+            for part in list(self.parts):
+                self.remove_part(part)
+            for part in parts:
+                self.add_part(part)
+        self.set_mass_state(mass_state)
+        super().set_state(body)
+        self.engine.set_state(engine)
+        self.pilot.set_state(pilot)
+        self.stats = dict(stats)
+        self.random.setstate(random_state)
+
+    # the fuel in the tanks, the sums over the parts and the center of
+    # gravity of the body
+    def get_mass_state(self):
+        return (tuple((tank.fuel, tank.mass) for tank in self.tanks),
+                self._mass,
+                self._mass_x, self._mass_y, self._moment, self._cog)
+
+    # restore the fuel in the tanks and the mass properties of the body
+    def set_mass_state(self, state):
+        tanks, self._mass, self._mass_x, self._mass_y, self._moment, cog = \
+            state
+        for tank, (fuel, mass) in zip(self.tanks, tanks):
+            tank.fuel = fuel
+            tank.mass = mass
+        self.body.center_of_gravity = self._cog = cog
+        self.update_mass_properties()
+
+    def shift_origin(self, offset):
+        self.pilot.shift_origin(offset)
+
     def noise(self, amplitude=0):
-        return 1 + amplitude * (2*random.random() - 1)
+        return 1 + amplitude * (2*self.random.random() - 1)
 
     # control the rocket using the pilot / autopilot
     def handle_controls(self, game):
@@ -93,45 +315,39 @@ class Rocket(Poly):
 
     # draw the rocket to the game's screen
     def draw(self, game):
-        # main body
-        ps = [p.rotated(self.body.angle) +
-              self.body.position for p in self.shape.get_vertices()]
-        ps.append(ps[0])
-        for i, p in enumerate(ps):
-            ps[i] = game.pos2screen(p)
-        pygame.draw.polygon(game.screen, pygame.Color(*self.color), ps)
-        pygame.draw.lines(game.screen, pygame.Color("black"), False, ps, 2)
-        # fins
+        body = self.body
+        # parts
+        for part in self.parts:
+            part.draw(game)
+        # fins (only drawn, if the rocket has no real ones)
         h = self.h
         w = self.w
-        fins = [(-w/2, -h/2.1), (-w*1.4, -h/2.1), (-w/2, -h/5), (-w/2, -h/2.1)]
-        fins = [pymunk.Vec2d(*p).rotated(self.body.angle) +
-                self.body.position for p in fins]
-        for i, p in enumerate(fins):
-            fins[i] = game.pos2screen(p)
-        pygame.draw.polygon(game.screen, pygame.Color(*self.color), fins)
-        pygame.draw.lines(game.screen, pygame.Color("black"), False, fins, 2)
-        fins = [(w/2, -h/2.1), (w*1.4, -h/2.1), (w/2, -h/5), (w/2, -h/2.1)]
-        fins = [pymunk.Vec2d(*p).rotated(self.body.angle) +
-                self.body.position for p in fins]
-        for i, p in enumerate(fins):
-            fins[i] = game.pos2screen(p)
-        pygame.draw.polygon(game.screen, pygame.Color(*self.color), fins)
-        pygame.draw.lines(game.screen, pygame.Color("black"), False, fins, 2)
+        if not self.has_part(Fins):
+            fins = [(-w/2, -h/2.1), (-w*1.4, -h/2.1), (-w/2, -h/5),
+                    (-w/2, -h/2.1)]
+            fins = game.local2screen(body, fins)
+            pygame.draw.polygon(game.screen, pygame.Color(*self.color), fins)
+            pygame.draw.lines(game.screen, pygame.Color("black"), False,
+                              fins, 2)
+            fins = [(w/2, -h/2.1), (w*1.4, -h/2.1), (w/2, -h/5),
+                    (w/2, -h/2.1)]
+            fins = game.local2screen(body, fins)
+            pygame.draw.polygon(game.screen, pygame.Color(*self.color), fins)
+            pygame.draw.lines(game.screen, pygame.Color("black"), False,
+                              fins, 2)
         # draw the engine
-        engine_position = self.body.position + \
-            self.engine_pos.rotated(self.body.angle)
-        self.engine.draw(game, engine_position, self.body.angle)
+        engine_position = game.local2pos(body, self.engine_pos)
+        with game.profiler.section("draw.flame"):
+            self.engine.draw(game, engine_position, game.draw_pose(body)[1])
+        # draw pilot information, e.g., the predicted trajectory
+        self.pilot.draw(game)
         # draw the airbrakes
         if self.airbrakes_enabled:
             airbs = [
                 (-w/2, 0.47*h), (-w*1.5, 0.47*h), (-w/2, 0.5*h),
                 (+w/2, 0.5*h), (+w*1.5, 0.47*h), (+w/2, 0.47*h)
             ]
-            airbs = [pymunk.Vec2d(*p).rotated(self.body.angle) +
-                     self.body.position for p in airbs]
-            for i, p in enumerate(airbs):
-                airbs[i] = game.pos2screen(p)
+            airbs = game.local2screen(body, airbs)
             pygame.draw.polygon(game.screen, pygame.Color(*self.color), airbs)
             pygame.draw.lines(game.screen, pygame.Color(
                 "black"), False, airbs, 2)
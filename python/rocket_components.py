@@ -1,37 +1,243 @@
-from objects import Poly
+import pygame
+import pymunk
+from pymunk import Vec2d
+from objects import Object
+
+
+# the centroid of a (convex) polygon
+def polygon_centroid(points):
+    area = cx = cy = 0
+    for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]):
+        cross = x1 * y2 - x2 * y1
+        area += cross
+        cx += (x1 + x2) * cross
+        cy += (y1 + y2) * cross
+    return Vec2d(cx / (3 * area), cy / (3 * area))
+
+
+class RocketPart(Object):
+    """
+    A part of a modular rocket: a convex polygon with a uniform density,
+    given in the local coordinates of the rocket (shifted by offset).
+    The mass properties of a part are computed once, when it is created.
+    Attached to a rocket, a part is a shape on the rocket's body,
+    a detached part is a free object with its own body.
+    """
+
+    # parts of the main body count for the rocket's dimensions (w and h),
+    # other parts (nose cone, fins, boosters) are mounted on it
+    BODY_PART = True
+    COLOR = 112, 122, 255
+
+    def __init__(self, points, mass, offset=(0, 0)):
+        super().__init__()
+        ox, oy = offset
+        self.points = [Vec2d(x + ox, y + oy) for x, y in points]
+        self.mass = mass
+        # center of gravity and moment of inertia about it, per unit mass
+        self.center = polygon_centroid(self.points)
+        self.moment_per_mass = pymunk.moment_for_poly(1, self.points) - \
+            self.center.dot(self.center)
+        self.drag_area = self.extent() * 2
+        self.color = self.COLOR
+        self.friction = 0.5
+
+    # largest distance of a vertex from the center of gravity
+    def extent(self):
+        return max((p - self.center).length for p in self.points)
+
+    # bounding box of the part in the local coordinates of the rocket
+    def bounds(self):
+        xs = [p.x for p in self.points]
+        ys = [p.y for p in self.points]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    # move the part (before it is attached) by (dx, dy)
+    def shift(self, dx, dy):
+        d = Vec2d(dx, dy)
+        self.points = [p + d for p in self.points]
+        self.center += d
+
+    # where to move a part that is not part of the main body, given the
+    # bounds of the main body (see stack), as (dx, dy)
+    def placement(self, left, bottom, right, top):
+        return 0, 0
+
+    # moment of inertia about the center of gravity
+    @property
+    def moment(self):
+        return self.mass * self.moment_per_mass
+
+    # attach the part to a body, as a new shape
+    def attach(self, body):
+        self.body = body
+        self.shape = pymunk.Poly(body, self.points)
+        self.shape.friction = self.friction
+
+    # detach the part from its body and give it a body of its own,
+    # moving along with the old body
+    def detach(self):
+        old_body = self.body
+        body = pymunk.Body(self.mass, self.moment)
+        body.position = old_body.local_to_world(self.center)
+        body.angle = old_body.angle
+        body.velocity = old_body.velocity_at_local_point(self.center)
+        body.angular_velocity = old_body.angular_velocity
+        self.body = body
+        self.shape = pymunk.Poly(body, [p - self.center for p in self.points])
+        self.shape.friction = self.friction
+
+    # draw the part as a filled polygon
+    def draw(self, game):
+        ps = game.local2screen(self.body, self.shape.get_vertices())
+        ps.append(ps[0])
+        pygame.draw.polygon(game.screen, pygame.Color(*self.color), ps)
+        pygame.draw.lines(game.screen, pygame.Color("black"), False, ps, 2)
+
+
+class Section(RocketPart):
+    """A cylindrical section of the main body."""
+
+    def __init__(self, w, h, mass, offset=(0, 0)):
+        points = [(-w/2, -h/2), (w/2, -h/2), (w/2, h/2), (-w/2, h/2)]
+        super().__init__(points, mass, offset)
+
+
+class FuelTank(Section):
+    """
+    A section of the main body filled with fuel. The mass is that of the
+    full tank, of which fuel_fraction is fuel. The fuel is evenly spread
+    over the tank, so its center of gravity and moment of inertia per mass
+    stay the same when it empties.
+    """
+
+    def __init__(self, w, h, mass, fuel_fraction=2/3, offset=(0, 0)):
+        super().__init__(w, h, mass, offset)
+        self.capacity = mass * fuel_fraction
+        self.fuel = self.capacity
+
+    # the mass of the empty tank
+    @property
+    def dry_mass(self):
+        return self.mass - self.fuel
+
+    # take up to an amount of fuel out of the tank, returns the amount taken
+    def drain(self, amount):
+        amount = min(amount, self.fuel)
+        self.fuel -= amount
+        self.mass -= amount
+        return amount
+
+    # fill the tank up, returns the amount of fuel added
+    def fill(self):
+        amount = self.capacity - self.fuel
+        self.fuel = self.capacity
+        self.mass += amount
+        return amount
 
 
-class RocketPart(Poly):
-    pass
+class JeEngine(Section):
+    """An engine section at the bottom of the main body."""
 
+    COLOR = 90, 90, 110
 
-class FuelTank(RocketPart):
-    pass
 
+class ReactionWheel(Section):
+    """A section of the main body holding a reaction wheel."""
 
-class JeEngine(RocketPart):
-    pass
+    COLOR = 150, 150, 170
 
 
-class Booster(RocketPart):
-    pass
+class Parachute(Section):
+    """A section of the main body holding a parachute."""
 
+    COLOR = 230, 140, 60
 
-class NoseCone(RocketPart):
-    pass
-
-
-class Fins(RocketPart):
-    pass
 
+class AirBrakes(Section):
+    """A section of the main body holding airbrakes."""
 
-class ReactionWheel(RocketPart):
-    pass
+    COLOR = 150, 160, 255
 
 
-class AirBrakes(RocketPart):
-    pass
-
-
-class Parachute(RocketPart):
-    pass
+class NoseCone(RocketPart):
+    """The tip of the rocket, on top of the main body."""
+
+    BODY_PART = False
+
+    def __init__(self, w, h, mass, offset=(0, 0)):
+        points = [(-w/2, -h/2), (w/2, -h/2), (0, h/2)]
+        super().__init__(points, mass, offset)
+
+    def placement(self, left, bottom, right, top):
+        return 0, top - self.bounds()[1]
+
+
+class SidePart(RocketPart):
+    """
+    A part on the left (side=-1) or right (side=1) of the main body,
+    flush with its bottom.
+    """
+
+    BODY_PART = False
+
+    def __init__(self, points, mass, side=1, offset=(0, 0)):
+        self.side = side
+        if side < 0:
+            points = [(-x, y) for x, y in reversed(points)]
+        super().__init__(points, mass, offset)
+
+    def placement(self, left, bottom, right, top):
+        x0, y0, x1, y1 = self.bounds()
+        if self.side < 0:
+            return left - x1, bottom - y0
+        return right - x0, bottom - y0
+
+
+class Fins(SidePart):
+    """A triangular fin."""
+
+    def __init__(self, span, h, mass, side=1, offset=(0, 0)):
+        points = [(0, -h/2), (span, -h/2), (0, h/2)]
+        super().__init__(points, mass, side, offset)
+
+
+class Booster(SidePart):
+    """A side booster with a pointed top, it can be burned off."""
+
+    def __init__(self, w, h, mass, side=1, offset=(0, 0)):
+        points = [(0, -h/2), (w, -h/2), (w, h/2 - w/2), (w/2, h/2),
+                  (0, h/2 - w/2)]
+        super().__init__(points, mass, side, offset)
+
+
+# assemble parts into a rocket shape: the parts of the main body are stacked
+# from bottom to top (in the given order) and centered around the origin,
+# the other parts are placed around them (see RocketPart.placement)
+def stack(parts):
+    y = 0
+    body_parts = [part for part in parts if part.BODY_PART]
+    for part in body_parts:
+        left, bottom, right, top = part.bounds()
+        part.shift(-(left + right) / 2, y - bottom)
+        y += top - bottom
+    for part in body_parts:
+        part.shift(0, -y / 2)
+    bounds = [part.bounds() for part in body_parts]
+    left = min(b[0] for b in bounds)
+    right = max(b[2] for b in bounds)
+    for part in parts:
+        if not part.BODY_PART:
+            part.shift(*part.placement(left, -y / 2, right, y / 2))
+    return parts
+
+
+# the total mass, center of gravity and moment of inertia (about the center
+# of gravity) of a list of parts
+def mass_properties(parts):
+    mass = sum(part.mass for part in parts)
+    center = sum((part.center * part.mass for part in parts), Vec2d(0, 0))
+    center /= mass
+    moment = sum(part.moment + part.mass * (part.center - center).dot(
+        part.center - center) for part in parts)
+    return mass, center, moment
@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class TelemetryRecorder():
+    """
+    Records the telemetry of a game's rocket at every physics step.
+    The samples are written into a preallocated ring buffer (one row per
+    step, one column per channel), so recording allocates no memory and
+    long runs keep only the latest samples. The buffer can be backed by a
+    memory-mapped file, and recordings are exported column by column to
+    NumPy's .npz format.
+    """
+
+    CHANNELS = ["time", "x", "y", "vx", "vy", "angle", "angular_velocity",
+                "thrust", "engine_angle", "ignited", "airbrakes", "sas_mode",
+                "fuel_used", "mass"]
+    # data types of the exported channels (float64 otherwise)
+    DTYPES = {"ignited": bool, "airbrakes": bool, "sas_mode": np.int8}
+
+    def __init__(self, capacity=600000, filename=None):
+        self.capacity = capacity
+        shape = (capacity, len(self.CHANNELS))
+        if filename is None:
+            self.buffer = np.zeros(shape)
+        else:
+            self.buffer = np.lib.format.open_memmap(
+                filename, mode="w+", dtype=np.float64, shape=shape)
+        # number of samples recorded so far (including overwritten ones)
+        self.count = 0
+        # names of the SAS modes, indexed by the recorded sas_mode codes
+        self.sas_modes = []
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    # code of a SAS mode name
+    def sas_code(self, sas_mode):
+        if sas_mode not in self.sas_modes:
+            self.sas_modes.append(sas_mode)
+        return self.sas_modes.index(sas_mode)
+
+    # record a sample of the telemetry of the game's rocket
+    def record(self, game):
+        rocket = game.rocket
+        body = rocket.body
+        engine = rocket.engine
+        x, y = game.to_world(body.position)
+        vx, vy = body.velocity
+        self.buffer[self.count % self.capacity] = (
+            game.time, x, y, vx, vy, body.angle, body.angular_velocity,
+            engine.thrust, engine.angle, engine.ignited,
+            rocket.airbrakes_enabled, self.sas_code(rocket.pilot.sas_mode),
+            rocket.stats["fuel_used"], rocket.mass)
+        self.count += 1
+
+    # the recorded samples of a channel, in chronological order
+    def column(self, name):
+        column = self.buffer[:, self.CHANNELS.index(name)]
+        start = self.count % self.capacity
+        if self.count < self.capacity:
+            column = column[:start]
+        else:
+            column = np.concatenate((column[start:], column[:start]))
+        return column.astype(self.DTYPES.get(name, np.float64))
+
+    # all recorded channels as a dict of arrays
+    def columns(self):
+        return {name: self.column(name) for name in self.CHANNELS}
+
+    # export the recording to a (compressed) .npz file
+    def export(self, filename, compressed=True):
+        save = np.savez_compressed if compressed else np.savez
+        save(filename, sas_modes=np.array(self.sas_modes), **self.columns())
+
+    # clear the recording
+    def clear(self):
+        self.count = 0
+        self.sas_modes = []
+
+
+# load an exported recording as a dict of arrays
+def load_telemetry(filename):
+    with np.load(filename) as data:
+        return {name: data[name] for name in data.files}
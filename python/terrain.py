@@ -0,0 +1,131 @@
+import math
+from collections import OrderedDict
+
+MASK64 = 2**64 - 1
+
+
+class Terrain():
+    """
+    The height of the ground over x: a flat base level with hills on top
+    of it, which flatten out towards the landing pads. The hills are value
+    noise: OCTAVES layers of random heights at points WAVELENGTH,
+    WAVELENGTH/2, ... apart, smoothly interpolated, each with half the
+    amplitude of the previous one. The ground is a polyline through
+    vertices every SEGMENT m, whose heights are generated chunk by chunk
+    (CHUNK m wide, centered at multiples of CHUNK) and cached for the
+    CACHE_SIZE most recently used chunks, so that a lookup costs a linear
+    interpolation. Without hills (amplitude 0), the ground is flat.
+    The chunks and vertices are in world coordinates, height and altitude
+    take coordinates in the pymunk Space, whose origin is at the world
+    position origin (see RocketGame.FLOATING_ORIGIN).
+    """
+
+    CHUNK = 1000  # in m
+    SEGMENT = 25  # distance of the vertices, in m
+    WAVELENGTH = 4000  # of the largest hills, in m
+    OCTAVES = 4
+    PAD_RAMP = 500  # the hills rise over this distance from a pad, in m
+    CACHE_SIZE = 64  # in chunks
+
+    def __init__(self, base=6, amplitude=0, pads=(), seed=0):
+        # height of the flat ground and largest height of the hills above
+        # it, in m
+        self.base = base
+        self.amplitude = amplitude
+        # the landing pads, as (center, width) in m
+        self.pads = list(pads)
+        self.seed = seed
+        # world position of the origin of the Space, in m
+        self.origin = (0, 0)
+        # the cached chunks {index: heights of the vertices}
+        self.chunks = OrderedDict()
+
+    # the index of the chunk at x
+    def chunk_index(self, x):
+        return math.floor(x / self.CHUNK + 0.5)
+
+    # the left and right edge of a chunk
+    def chunk_bounds(self, index):
+        return (index - 0.5) * self.CHUNK, (index + 0.5) * self.CHUNK
+
+    # the vertices of the ground in a chunk, as a list of (x, height) from
+    # its left to its right edge
+    def vertices(self, index):
+        left = self.chunk_bounds(index)[0]
+        return [(left + i * self.SEGMENT, height)
+                for i, height in enumerate(self.chunk_heights(index))]
+
+    # the heights of the vertices of a chunk (generated or from the cache)
+    def chunk_heights(self, index):
+        chunks = self.chunks
+        heights = chunks.get(index)
+        if heights is not None:
+            chunks.move_to_end(index)
+            return heights
+        left = self.chunk_bounds(index)[0]
+        n = round(self.CHUNK / self.SEGMENT)
+        heights = [self.base + self.hills(left + i * self.SEGMENT)
+                   for i in range(n + 1)]
+        chunks[index] = heights
+        if len(chunks) > self.CACHE_SIZE:
+            chunks.popitem(last=False)
+        return heights
+
+    # the height of the ground at x, in the coordinates of the Space
+    def height(self, x):
+        ox, oy = self.origin
+        return self.world_height(x + ox) - oy
+
+    # the height of the ground at x, in world coordinates
+    def world_height(self, x):
+        if not self.amplitude:
+            return self.base
+        index = math.floor(x / self.CHUNK + 0.5)
+        heights = self.chunk_heights(index)
+        u = (x - (index - 0.5) * self.CHUNK) / self.SEGMENT
+        i = min(int(u), len(heights) - 2)
+        a = heights[i]
+        return a + (heights[i + 1] - a) * (u - i)
+
+    # the height of a point (x, y) in the Space above the base level of
+    # the ground, less the elevation of the ground at x over its base level
+    def altitude(self, x, y):
+        return y - (self.height(x) - self.base)
+
+    # the height of the hills at x (between 0 and the amplitude)
+    def hills(self, x):
+        if not self.amplitude:
+            return 0
+        total = norm = 0
+        weight = 1
+        for octave in range(self.OCTAVES):
+            u = x / self.WAVELENGTH * 2**octave
+            k = math.floor(u)
+            t = u - k
+            t = t * t * (3 - 2 * t)
+            a = self.noise(octave, k)
+            total += weight * (a + (self.noise(octave, k + 1) - a) * t)
+            norm += weight
+            weight /= 2
+        height = self.amplitude * total / norm
+        for center, width in self.pads:
+            distance = abs(x - center) - width / 2
+            if distance < self.PAD_RAMP:
+                height *= max(distance, 0) / self.PAD_RAMP
+        return height
+
+    # a random number in [0, 1) for a point k of an octave of the noise
+    # (a hash of the seed, octave and k)
+    def noise(self, octave, k):
+        h = (self.seed * 0x9E3779B97F4A7C15 + octave * 0xD1B54A32D192ED03 +
+             k * 0x94D049BB133111EB) & MASK64
+        h ^= h >> 31
+        h = (h * 0xBF58476D1CE4E5B9) & MASK64
+        h ^= h >> 29
+        h = (h * 0x94D049BB133111EB) & MASK64
+        h ^= h >> 32
+        return h / 2**64
+
+
+# the terrain of objects that are not part of a game
+FLAT_TERRAIN = Terrain()
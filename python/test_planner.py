@@ -0,0 +1,35 @@
+import os
+import pytest
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+from game import RocketGame  # noqa: E402
+from tests import ALL_TESTS  # noqa: E402
+from batch import run_scenario  # noqa: E402
+
+# hardest tolerated impact of a landing, in m/s
+MAX_TOUCHDOWN = 25
+
+
+@pytest.mark.parametrize("index", range(len(ALL_TESTS)))
+def test_lands_upright(index):
+    result = run_scenario(index, max_time=60)
+    assert result["finished"]
+    assert result["upright"], result["final_angle"]
+    v = result["touchdown_velocity"]
+    assert v is None or v < MAX_TOUCHDOWN
+
+
+def test_land_at_rest():
+    game = RocketGame(headless=True, seed=0)
+    rocket = game.rocket
+    rocket.engine.ignited = False
+    game.simulate(3)
+    angle = rocket.body.angle
+    # the rocket stands on the ground, engaging "land" does not fire
+    rocket.engine.ignited = True
+    rocket.pilot.sas_mode = "land"
+    for _ in range(50):
+        game.handle_controls()
+        assert not rocket.engine.ignited
+        game.update_frame_physics()
+    assert rocket.pilot.sas_mode == "OFF"
+    assert abs(rocket.body.angle - angle) < 1e-3
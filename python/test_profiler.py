@@ -0,0 +1,19 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+from profiler import Profiler  # noqa: E402
+
+
+def test_overlay_keeps_requested_profiling():
+    profiler = Profiler()
+    profiler.toggle_overlay()
+    assert profiler.enabled
+    profiler.toggle_overlay()
+    assert not profiler.enabled
+    # profiling started on its own (--profile) outlives the overlay
+    profiler.start()
+    profiler.toggle_overlay()
+    profiler.toggle_overlay()
+    assert profiler.enabled
+    with profiler.section("step"):
+        pass
+    assert profiler.report()["step"]["count"] == 1
@@ -0,0 +1,73 @@
+import os
+import copy
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+from game import RocketGame  # noqa: E402
+from objects import Ball, Wall  # noqa: E402
+from tests import ALL_TESTS  # noqa: E402
+
+
+# a headless game with the rocket flying a landing test
+def flying_game(index=3):
+    game = RocketGame(headless=True, seed=0)
+    test = copy.copy(ALL_TESTS[index])
+    test.verbose = False
+    test.next_test = None
+    test.start(game)
+    game.simulate(1)
+    return game
+
+
+# the state of the rocket's flight
+def flight(game):
+    rocket = game.rocket
+    return (game.time, game.frame, tuple(rocket.body.position),
+            tuple(rocket.body.velocity), rocket.body.angle,
+            rocket.body.angular_velocity, rocket.engine.thrust,
+            rocket.stats["fuel_used"], rocket.pilot.sas_mode)
+
+
+def test_restore_is_deterministic():
+    game = flying_game()
+    state = game.snapshot()
+    game.simulate(2)
+    expected = flight(game)
+    # a snapshot can be restored any number of times
+    for _ in range(2):
+        game.restore(state)
+        game.simulate(2)
+        assert flight(game) == expected
+
+
+def test_restore_removes_added_objects():
+    game = flying_game()
+    n_objects = len(game.objects)
+    state = game.snapshot()
+    ball = game.add_object(Ball(game.space, 500, 500))
+    game.simulate(0.5)
+    game.restore(state)
+    assert ball not in game.objects
+    assert len(game.objects) == n_objects
+    assert ball.body not in game.space.bodies
+    assert ball.shape not in game.space.shapes
+
+
+def test_registry_remove():
+    game = RocketGame(headless=True, seed=0)
+    space = game.space
+    ball = game.add_object(Ball(space, 500, 500))
+    wall = game.add_object(Wall(space, (0, 300), (100, 300)))
+    assert ball in game.objects.of_type(Ball)
+    game.remove_object(ball)
+    game.remove_object(wall)
+    # removing twice does nothing
+    game.remove_object(ball)
+    assert ball not in game.objects
+    assert ball not in game.objects.of_type(Ball)
+    assert ball not in game.objects.passive
+    assert ball.body not in space.bodies
+    assert ball.shape not in space.shapes
+    assert wall not in game.objects
+    assert wall.shape not in space.shapes
+    # the static body of the space stays
+    assert space.static_body.space is space
+    assert game.objects.owner(wall.shape) is None
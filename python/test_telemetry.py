@@ -0,0 +1,35 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+from game import RocketGame  # noqa: E402
+from telemetry import TelemetryRecorder  # noqa: E402
+
+
+# record n physics steps of a headless game with a recorder of a capacity
+def record(n, capacity):
+    game = RocketGame(headless=True, seed=0)
+    game.recorder = TelemetryRecorder(capacity)
+    for _ in range(n):
+        game.update_physics()
+    return game.recorder
+
+
+def test_partly_full():
+    recorder = record(3, 4)
+    assert len(recorder) == 3
+    assert len(recorder.column("time")) == 3
+
+
+def test_exactly_full():
+    recorder = record(4, 4)
+    assert len(recorder) == 4
+    times = recorder.column("time")
+    assert len(times) == 4
+    assert list(times) == sorted(times)
+
+
+def test_wrapped_around():
+    recorder = record(6, 4)
+    assert len(recorder) == 4
+    times = recorder.column("time")
+    assert list(times) == sorted(times)
+    assert times[-1] == recorder.buffer[1, 0]
@@ -0,0 +1,16 @@
+import os
+import pytest
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+from vectorized import RocketBatch  # noqa: E402
+from tests import ALL_TESTS  # noqa: E402
+from batch import run_scenario  # noqa: E402
+
+
+@pytest.mark.parametrize("gains", [{}, {"land_safety": 0.9},
+                                   {"steering_damping": 0.6}])
+def test_gains_match_pymunk(gains):
+    batch = RocketBatch.from_tests(ALL_TESTS[:1], gains=gains)
+    batch.simulate(60)
+    result = run_scenario(0, 60, sas_mode="land (heuristic)", gains=gains)
+    assert batch.results()["fuel_used"][0] == \
+        pytest.approx(result["fuel_used"], rel=1e-2)
@@ -8,6 +8,9 @@ class Test():
     and measures some statistics and results.
     """
 
+    # largest tilt of a rocket that counts as upright at the end, in rad
+    MAX_TILT = 0.3
+
     def __init__(self):
         self.rocket_position = pymunk.Vec2d(0, 1000)
         self.rocket_velocity = pymunk.Vec2d(0, 0)
@@ -21,27 +24,40 @@ class Test():
         self.stats_after = None
         self.next_test = None
         self.ignore_height = False
+        self.last_velocity = None
+        self.touchdown_velocity = None
+        # print progress and results to stdout
+        self.verbose = True
 
     def start(self, game):
-        print("Running test...")
+        if self.verbose:
+            print("Running test...")
         # apply setup
         self.game = game
         game.test = self
         rocket = game.rocket
-        rocket.body.position = self.rocket_position
-        rocket.body.velocity = self.rocket_velocity
-        rocket.body.angle = self.rocket_angle
+        # the start position is in world coordinates
+        rocket.set_body_state(game.to_space(self.rocket_position),
+                              self.rocket_velocity,
+                              self.rocket_angle, self.rocket_angular_velocity)
+        rocket.refuel()
         rocket.engine.ignited = True
-        rocket.body.angular_velocity = self.rocket_angular_velocity
         rocket.pilot.sas_mode = self.sas_mode
         # measure stats before
         self.stats_before = rocket.stats.copy()
         self.t_before = self.game.time
+        self.stats_after = None
+        self.last_velocity = None
+        self.touchdown_velocity = None
 
+    # check whether the rocket came to rest (whether it is upright is part
+    # of the results, see is_upright)
     def is_finished(self):
         # check if the rocket landed
         rocket = self.game.rocket
-        h = rocket.body.position.y
+        # height above the base level of the ground
+        position = rocket.body.position
+        h = rocket.terrain.altitude(position.x, position.y)
         v = rocket.body.velocity
         if (h > 200 and not self.ignore_height):
             return False
@@ -51,17 +67,73 @@ class Test():
         self.stats_after = rocket.stats.copy()
         self.t_after = self.game.time
         # display test results
-        self.display_results()
-        print("Test finished.\n")
+        if self.verbose:
+            self.display_results()
+            print("Test finished.\n")
         return True
 
+    # record the largest impact speed of the rocket over all its contacts
+    # (with the ground or other bodies, including bounces), called after
+    # every physics step (see RocketGame.update_physics), so that the
+    # velocity is the one before the step in which the rocket hit
+    def record_touchdown(self):
+        body = self.game.rocket.body
+        contacts = []
+        body.each_arbiter(contacts.append)
+        if contacts:
+            velocity = self.last_velocity
+            if velocity is None:
+                velocity = body.velocity
+            if self.touchdown_velocity is None or \
+                    velocity.length > self.touchdown_velocity:
+                self.touchdown_velocity = velocity.length
+        self.last_velocity = body.velocity
+
+    # the angle of the rocket from the vertical, between -pi and pi
+    def tilt(self):
+        angle = self.game.rocket.body.angle
+        return (angle + math.pi) % (2 * math.pi) - math.pi
+
+    # check whether the rocket is upright (see MAX_TILT)
+    def is_upright(self):
+        return abs(self.tilt()) <= self.MAX_TILT
+
+    # get the progress of the test (see set_state)
+    def get_state(self):
+        stats_before = self.stats_before and self.stats_before.copy()
+        stats_after = self.stats_after and self.stats_after.copy()
+        return (stats_before, self.t_before, stats_after, self.t_after,
+                self.last_velocity, self.touchdown_velocity)
+
+    # restore a state captured with get_state
+    def set_state(self, state):
+        (stats_before, self.t_before, stats_after, self.t_after,
+         self.last_velocity, self.touchdown_velocity) = state
+        self.stats_before = stats_before and stats_before.copy()
+        self.stats_after = stats_after and stats_after.copy()
+
+    # get the test results (up to now, if the test is not finished yet)
+    def results(self):
+        stats_after, t_after = self.stats_after, self.t_after
+        if stats_after is None:
+            stats_after, t_after = self.game.rocket.stats, self.game.time
+        return {
+            "fuel_used": stats_after["fuel_used"] - self.stats_before["fuel_used"],
+            "time_taken": t_after - self.t_before,
+            "touchdown_velocity": self.touchdown_velocity,
+            "final_angle": self.tilt(),
+            "upright": self.is_upright(),
+        }
+
     # display test results
     def display_results(self):
-        fuel_used = self.stats_after["fuel_used"] - \
-            self.stats_before["fuel_used"]
-        time_taken = self.t_after - self.t_before
-        print(f"Fuel used: {fuel_used:f}")
-        print(f"Time taken: {time_taken:f}")
+        results = self.results()
+        print(f"Fuel used: {results['fuel_used']:f}")
+        print(f"Time taken: {results['time_taken']:f}")
+        if results["touchdown_velocity"] is not None:
+            print(f"Touchdown velocity: {results['touchdown_velocity']:f}")
+        print(f"Final angle: {results['final_angle']:f}"
+              f"{'' if results['upright'] else ' (not upright)'}")
 
 
 # List of all tests
@@ -0,0 +1,195 @@
+from collections import deque
+import pygame
+from pymunk import Vec2d
+
+
+class TrajectoryPredictor():
+    """
+    Predicts the ballistic trajectory of a rocket (gravity and drag, no thrust)
+    by forward integration, without touching the pymunk Space.
+    The prediction is cached and updated incrementally: passed points are
+    dropped, small deviations of the rocket from the cached arc are absorbed
+    by a linear correction, and the arc is extended by a bounded number of
+    integration steps per update. Only large deviations (e.g., when the
+    engine fires) make it start over from the current state.
+    Updates are lazy: update() only marks the prediction as outdated, the
+    work is done when the prediction is accessed.
+    """
+
+    DT = 0.05  # integration time step, in seconds
+    HORIZON = 300  # largest predicted time, in seconds
+    MAX_STEPS = 100  # largest number of integration steps per update
+    TOLERANCE = 1  # largest velocity deviation before recomputing, in m/s
+
+    def __init__(self, rocket):
+        self.rocket = rocket
+        # the cached prediction, as tuples (time, position, velocity)
+        self.points = deque()
+        # orientation of the rocket assumed for the drag
+        self.rotation_vector = Vec2d(1, 0)
+        # linear correction of the cached points: offset + drift * time
+        self.offset = Vec2d(0, 0)
+        self.drift = Vec2d(0, 0)
+        # cached impact on the ground (time, position, velocity), if found
+        self.impact = None
+        # predicted impact point and time, with correction
+        self.time = 0
+        self.outdated = False
+        self._impact_point = None
+        self._impact_time = None
+        # number of times the prediction started over
+        self.recomputations = 0
+
+    # mark the prediction as outdated, it will be updated to the state of
+    # the rocket at this time when it is accessed
+    def update(self, time):
+        self.time = time
+        self.outdated = True
+
+    # the predicted point of impact on the ground (or None)
+    @property
+    def impact_point(self):
+        self.refresh()
+        return self._impact_point
+
+    # the predicted time of impact on the ground (or None)
+    @property
+    def impact_time(self):
+        self.refresh()
+        return self._impact_time
+
+    # the predicted time until impact on the ground (or None)
+    @property
+    def time_to_impact(self):
+        self.refresh()
+        if self._impact_time is None:
+            return None
+        return max(self._impact_time - self.time, 0)
+
+    # update the prediction to the current state of the rocket, if outdated
+    def refresh(self):
+        if not self.outdated:
+            return
+        self.outdated = False
+        body = self.rocket.body
+        time = self.time
+        # drop the points that have passed
+        points = self.points
+        while len(points) > 1 and points[1][0] <= time:
+            points.popleft()
+        if len(points) < 2 or points[0][0] > time:
+            self.reset(time)
+        else:
+            # deviation of the rocket from the corrected prediction
+            (t0, p0, v0), (t1, p1, v1) = points[0], points[1]
+            frac = (time - t0) / (t1 - t0)
+            dv = body.velocity - (v0 + (v1 - v0) * frac + self.drift)
+            if dv.length > self.TOLERANCE:
+                self.reset(time)
+            else:
+                p = p0 + (p1 - p0) * frac + self.correction(time)
+                dp = body.position - p
+                # p(t) += dp + dv * (t - time) for all following points
+                self.offset += dp - dv * time
+                self.drift += dv
+        self.extend()
+        self.update_impact()
+
+    # start the prediction over from the current state of the rocket
+    def reset(self, time):
+        body = self.rocket.body
+        self.points = deque([(time, body.position, body.velocity)])
+        self.rotation_vector = body.rotation_vector
+        self.offset = Vec2d(0, 0)
+        self.drift = Vec2d(0, 0)
+        self.impact = None
+        self.recomputations += 1
+
+    # drop the cached prediction, it is recomputed when accessed
+    def clear(self):
+        self.points.clear()
+        self.impact = None
+        self.outdated = True
+
+    # move the cached prediction by -offset, when the origin of the Space
+    # moved by offset (see RocketGame.move_origin)
+    def shift(self, offset):
+        self.points = deque((t, p - offset, v) for t, p, v in self.points)
+        if self.impact is not None:
+            t, p, v = self.impact
+            self.impact = (t, p - offset, v)
+        if self._impact_point is not None:
+            self._impact_point -= offset
+
+    # correction of the cached points at a given time
+    def correction(self, time):
+        return self.offset + self.drift * time
+
+    # integrate the trajectory further, until it hits the ground
+    def extend(self):
+        if self.impact is not None:
+            return
+        rocket = self.rocket
+        dt = self.DT
+        gravity = rocket.space.gravity
+        # height of the rocket's center when it stands on the ground at x
+        terrain = rocket.terrain
+        offset = rocket.h / 2
+        t, p, v = self.points[-1]
+        bottom = terrain.height(p.x) + offset
+        if p.y <= bottom:
+            self.impact = self.points[-1]
+            return
+        for _ in range(self.MAX_STEPS):
+            if t - self.time > self.HORIZON:
+                return
+            # semi-implicit Euler step, as in pymunk
+            drag = rocket.drag_force(v, self.rotation_vector, p.y)
+            p1 = p + v * dt
+            v1 = v + (gravity + drag / rocket.mass) * dt
+            t1 = t + dt
+            bottom1 = terrain.height(p1.x) + offset
+            if p1.y <= bottom1:
+                # interpolate the point of impact
+                frac = (p.y - bottom) / (p.y - bottom - p1.y + bottom1)
+                self.impact = (t + frac * dt, p + (p1 - p) * frac,
+                               v + (v1 - v) * frac)
+                self.points.append(self.impact)
+                return
+            t, p, v, bottom = t1, p1, v1, bottom1
+            self.points.append((t, p, v))
+
+    # apply the correction to the predicted impact
+    def update_impact(self):
+        if self.impact is None:
+            self._impact_point = None
+            self._impact_time = None
+            return
+        t, p, v = self.impact
+        c = self.correction(t)
+        v = v + self.drift
+        # shift the impact along the trajectory to the ground
+        s = -c.y / v.y if v.y < 0 else 0
+        self._impact_point = p + c + v * s
+        self._impact_time = t + s
+
+    # the predicted (and corrected) positions of the rocket
+    def trajectory(self):
+        self.refresh()
+        return [p + self.correction(t) for t, p, v in self.points]
+
+    # draw the predicted trajectory and impact point on the game's screen
+    def draw(self, game, max_points=100):
+        points = self.trajectory()
+        points = points[::max(len(points) // max_points, 1)]
+        if self.impact_point is not None:
+            points.append(self.impact_point)
+        if len(points) < 2:
+            return
+        color = pygame.Color("gray50")
+        ps = game.points2screen(points)
+        pygame.draw.lines(game.screen, color, False, ps, 1)
+        if self.impact_point is not None:
+            x, y = ps[-1]
+            pygame.draw.line(game.screen, color, (x-6, y-6), (x+6, y+6), 2)
+            pygame.draw.line(game.screen, color, (x-6, y+6), (x+6, y-6), 2)
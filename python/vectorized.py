@@ -0,0 +1,410 @@
+import math
+import numpy as np
+from engine import Engine
+from rocket import Rocket
+from pilot import Autopilot
+from rocket_components import FuelTank
+from atmosphere import Atmosphere
+
+
+class RocketBatch():
+    """
+    Simulates many rockets at once, without pymunk. The state of all rockets
+    is stored in NumPy arrays and advanced together, using the same thrust,
+    drag and gravity model as the Rocket class and the same control laws as
+    the Autopilot. The fuel tank empties as in the Rocket class, which moves
+    the center of gravity of each rocket along its axis. Rockets touch down
+    on the ground (see ground_height, flat at GROUND_HEIGHT) and are frozen
+    there. The control laws read the gains of the Autopilot (see
+    Autopilot.GAINS), which can be overridden per batch.
+    This is meant for Monte Carlo sweeps, e.g., for tuning the autopilot.
+    """
+
+    # Settings, as in RocketGame
+    GRAVITY = 600
+    WIND = 0  # wind speed at Atmosphere.WIND_HEIGHT, in m/s
+    DT = 1. / 1000.  # in seconds
+    FPS = 50
+    GROUND_HEIGHT = 6  # top of the ground walls
+
+    # SAS modes, indexed by the codes stored in self.sas_mode
+    SAS_MODES = ["OFF", "assist", "stabilize", "hover", "land (heuristic)"]
+    # the landing planner is not vectorized, rockets in the "land" mode
+    # follow the heuristic control law instead
+    SAS_ALIASES = {"land": "land (heuristic)"}
+
+    def __init__(self, n, w=15, h=150, mass=300e3, gains=None):
+        self.n = n
+        self.time = 0
+        # gains of the control laws, as Autopilot.gains
+        self.gains = dict(Autopilot.GAINS)
+        self.gains.update(gains or {})
+
+        # rocket dimensions and mass properties (of the default Rocket), as
+        # the sums over its parts in Rocket, the rocket is symmetric, so its
+        # center of gravity is on its axis at the height cog_y above the
+        # origin (moved only by more than Rocket.COG_TOLERANCE)
+        self.w = w
+        self.h = h
+        parts = Rocket.default_parts(w, h, mass)
+        tank, = [part for part in parts if isinstance(part, FuelTank)]
+        self.tank_y = tank.center.y
+        self.tank_moment_per_mass = tank.moment_per_mass + self.tank_y**2
+        self.capacity = tank.capacity
+        self.fuel = np.full(n, tank.fuel)
+        self.mass = np.zeros(n)
+        self._mass_y = np.zeros(n)
+        self._moment = np.zeros(n)
+        for part in parts:
+            cx, cy = part.center
+            self.mass += part.mass
+            self._mass_y += cy * part.mass
+            self._moment += (part.moment_per_mass + cx*cx + cy*cy) * part.mass
+        self.cog_y = self._mass_y / self.mass
+        self.moment = self._moment - self.mass * self.cog_y**2
+        self.COG_TOLERANCE = Rocket.COG_TOLERANCE
+        # hull points in local coordinates (relative to the origin), and
+        # a bound of their distance to the center of gravity
+        self.points = np.array([p for part in parts for p in part.points])
+        self.radius = np.hypot(*self.points.T).max() + \
+            np.abs(self.cog_y).max()
+        # extent of all parts across and along the axis, for the drag
+        self.span, self.length = self.points.max(0) - self.points.min(0)
+        self.drag_coeff = 1e-5
+        self.engine_pos_y = -h/2
+
+        # the lookup tables of the air density and wind over the height
+        atmosphere = Atmosphere(wind=self.WIND)
+        self.heights = np.array(atmosphere.heights)
+        self.densities = np.array(atmosphere.densities)
+        self.winds = np.array(atmosphere.winds) if self.WIND else None
+
+        # engine limits (as in Engine)
+        engine = Engine()
+        self.MAX_THRUST = engine.MAX_THRUST
+        self.MIN_THRUST = engine.MIN_THRUST
+        self.MAX_THRUST_CHANGE = engine.MAX_THRUST_CHANGE
+        self.MAX_ANGLE = engine.MAX_ANGLE
+        self.MAX_ANGLE_CHANGE = engine.MAX_ANGLE_CHANGE
+        self.FUEL_CONSUMPTION = engine.FUEL_CONSUMPTION
+
+        # rocket state, the position and velocity are those of the center
+        # of gravity (see the position property for the rocket's origin)
+        self.center = np.zeros((n, 2))
+        self.center[:, 1] = 100 + self.cog_y
+        self.velocity = np.zeros((n, 2))
+        self.angle = np.zeros(n)
+        self.angular_velocity = np.zeros(n)
+
+        # engine, airbrakes and autopilot state
+        self.thrust = np.full(n, self.MAX_THRUST)
+        self.engine_angle = np.zeros(n)
+        self.ignited = np.zeros(n, dtype=bool)
+        self.airbrakes_enabled = np.zeros(n, dtype=bool)
+        self.sas_mode = np.zeros(n, dtype=np.int8)
+
+        # statistics
+        self.fuel_used = np.zeros(n)
+        self.landed = np.zeros(n, dtype=bool)
+        self.touchdown_time = np.full(n, np.nan)
+        self.touchdown_velocity = np.full(n, np.nan)
+        self.touchdown_angle = np.full(n, np.nan)
+        # gravitational acceleration of each rocket (zero once landed)
+        self._gravity = np.full(n, float(self.GRAVITY))
+
+    # the positions of the rockets' origins (as Rocket.body.position)
+    @property
+    def position(self):
+        return self.center - self.cog_offset()
+
+    # the offset of the center of gravity from the origin, in global
+    # coordinates
+    def cog_offset(self, angle=None):
+        if angle is None:
+            angle = self.angle
+        return self.cog_y[:, None] * \
+            np.stack([-np.sin(angle), np.cos(angle)], axis=1)
+
+    # set the start state of the rockets (as in Test.start), the position
+    # is that of the rockets' origins, arguments are scalars or arrays
+    # of length n
+    def start(self, position, velocity=(0, 0), angle=0, angular_velocity=0,
+              sas_mode="land (heuristic)"):
+        self.velocity[:] = velocity
+        self.angle[:] = angle
+        self.center[:] = position
+        self.center += self.cog_offset()
+        self.angular_velocity[:] = angular_velocity
+        if isinstance(sas_mode, str):
+            sas_mode = self.sas_code(sas_mode)
+        else:
+            sas_mode = [self.sas_code(m) for m in sas_mode]
+        self.sas_mode[:] = sas_mode
+        self.ignited[:] = True
+
+    # code of a SAS mode name
+    def sas_code(self, sas_mode):
+        name = self.SAS_ALIASES.get(sas_mode, sas_mode)
+        if name not in self.SAS_MODES:
+            raise ValueError(f"SAS mode {sas_mode!r} is not vectorized, use "
+                             f"one of {', '.join(self.SAS_MODES)}")
+        return self.SAS_MODES.index(name)
+
+    # create a batch with the start states of a list of Test objects
+    @classmethod
+    def from_tests(cls, tests, gains=None):
+        batch = cls(len(tests), gains=gains)
+        batch.start([t.rocket_position for t in tests],
+                    [t.rocket_velocity for t in tests],
+                    [t.rocket_angle for t in tests],
+                    [t.rocket_angular_velocity for t in tests],
+                    [t.sas_mode for t in tests])
+        return batch
+
+    # create a batch of n rockets with randomly sampled start states,
+    # each range is a tuple (min, max) of a uniform distribution
+    @classmethod
+    def sample(cls, n, rng=None, height=(1e3, 1e4), velocity_x=(-1e3, 1e3),
+               velocity_y=(-500, 0), angle=(-math.pi, math.pi),
+               angular_velocity=(-10, 10), sas_mode="land (heuristic)",
+               gains=None):
+        rng = np.random.default_rng(rng)
+        batch = cls(n, gains=gains)
+        position = np.zeros((n, 2))
+        position[:, 1] = rng.uniform(*height, n)
+        velocity = np.stack([rng.uniform(*velocity_x, n),
+                             rng.uniform(*velocity_y, n)], axis=1)
+        batch.start(position, velocity, rng.uniform(*angle, n),
+                    rng.uniform(*angular_velocity, n), sas_mode)
+        return batch
+
+    # Engine.set_thrust for all rockets (where mask is True)
+    def set_thrust(self, thrust, mask=True):
+        thrust = np.clip(thrust, self.thrust - self.MAX_THRUST_CHANGE,
+                         self.thrust + self.MAX_THRUST_CHANGE)
+        thrust = np.clip(thrust, self.MIN_THRUST, self.MAX_THRUST)
+        self.thrust = np.where(mask, thrust, self.thrust)
+
+    # Engine.set_angle for all rockets (where mask is True)
+    def set_engine_angle(self, angle, mask=True):
+        angle = np.clip(angle, self.engine_angle - self.MAX_ANGLE_CHANGE,
+                        self.engine_angle + self.MAX_ANGLE_CHANGE)
+        angle = np.clip(angle, -self.MAX_ANGLE, self.MAX_ANGLE)
+        self.engine_angle = np.where(mask, angle, self.engine_angle)
+
+    # the height of the ground below each rocket, given the x coordinates
+    # of the rockets
+    def ground_height(self, x):
+        return np.full(len(x), float(self.GROUND_HEIGHT))
+
+    # vectorized version of Autopilot.auto_controls
+    def auto_controls(self):
+        sas = self.sas_mode
+        vx, vy = self.velocity.T
+        # height of the origins above the base level of the ground, less
+        # the elevation of the ground below them (as Terrain.altitude)
+        x = self.center[:, 0] + self.cog_y * np.sin(self.angle)
+        y = self.center[:, 1] - self.cog_y * np.cos(self.angle)
+        y -= self.ground_height(x) - self.GROUND_HEIGHT
+        angle = (self.angle + math.pi) % (2 * math.pi) - math.pi
+        angular_velocity = self.angular_velocity
+        m = self.mass
+        g = self.GRAVITY
+        gains = self.gains
+        assist, stabilize, hover, land = 1, 2, 3, 4
+
+        # keep the rocket stable by cancelling angular velocity
+        self.set_engine_angle(
+            self.engine_angle - gains["assist_damping"]*angular_velocity,
+            sas == assist)
+
+        # cancel rocket angle and lateral velocity
+        steer = sas >= stabilize
+        momentum_weight = np.where(sas == stabilize, 0,
+                                   gains["momentum_weight"])
+        target_angle = np.arctan2(momentum_weight * vx,
+                                  -(momentum_weight * vy - g))
+        thrust_angle = target_angle - angle - \
+            gains["steering_damping"]*angular_velocity
+        self.set_engine_angle(thrust_angle, steer)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cos = np.abs(np.cos(self.engine_angle - angle))
+
+            # control engine thrust for hovering
+            thrust = m * g - m * vy
+            thrust *= np.minimum(1. / cos, gains["hover_cos_cap"])
+            self.set_thrust(thrust, sas == hover)
+
+            # control thrust for landing
+            landing = sas == land
+            h = y - self.h / 1.9
+            thrust = 2 * vy**2 * m / h + g
+            thrust *= np.minimum(1. / cos, gains["land_cos_cap"])
+            thrust *= gains["land_safety"]
+        cut_off = (vy > 0) | (thrust < self.MIN_THRUST)
+        self.ignited = np.where(landing, ~cut_off, self.ignited)
+        self.set_thrust(thrust, landing)
+        self.airbrakes_enabled |= landing
+        # kill thrust and stop landing mode when too low
+        done = landing & (y < self.h / 1.8)
+        self.ignited &= ~done
+        self.airbrakes_enabled &= ~done
+        self.sas_mode[done] = 0
+        # landed rockets stay landed
+        self.ignited &= ~self.landed
+
+    # perform a single physics time step (Rocket.update_drag,
+    # Rocket.update_forces and a pymunk step) for all rockets in flight,
+    # landed rockets have zero velocity and thrust and so only need
+    # to be excluded from gravity
+    def update_physics(self):
+        dt = self.DT
+        x, y = self.center.T
+        vx, vy = self.velocity.T
+        cos, sin = np.cos(self.angle), np.sin(self.angle)
+
+        # aerodynamic drag
+        fx, fy, torque = self.drag_forces(cos, sin)
+        # relax angular velocity (by 0.1% per millisecond)
+        self.angular_velocity *= 0.999 ** (dt / 1e-3)
+
+        # engine thrust and fuel consumption
+        thrust, burned = self.burn_fuel(dt)
+        self.update_mass(burned, cos, sin)
+        thrust_x, thrust_y, thrust_torque = self.thrust_forces(
+            thrust, cos, sin)
+        fx += thrust_x
+        fy += thrust_y
+        torque += thrust_torque
+
+        # semi-implicit Euler step, in the same order as pymunk
+        x += vx * dt
+        y += vy * dt
+        self.angle += self.angular_velocity * dt
+        vx += fx * (dt / self.mass)
+        vy += fy * (dt / self.mass) - self._gravity * dt
+        self.angular_velocity += torque * (dt / self.moment)
+        self.time += dt
+
+        # detect touchdown of the lowest hull point on the ground,
+        # only for rockets that are close to it
+        ground = self.ground_height(x)
+        near = y <= ground + self.radius
+        near &= ~self.landed
+        if near.any():
+            index = np.flatnonzero(near)
+            self.detect_touchdown(index, ground[index])
+
+    # the aerodynamic drag forces (at the centers of gravity) and their
+    # torques (Rocket.update_drag), given the rotation of the rockets, with
+    # the air density and wind at the height of the rockets' origins
+    # (as Atmosphere.lookup)
+    def drag_forces(self, cos, sin):
+        vx, vy = self.velocity.T
+        height = self.center[:, 1] - self.cog_y * cos
+        air_vx = vx
+        if self.winds is not None:
+            air_vx = vx - np.interp(height, self.heights, self.winds)
+        speed = np.hypot(air_vx, vy)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            A = np.abs(air_vx * cos + vy * sin) / speed
+        A[speed == 0] = 0
+        A = A * (self.length**2 - self.span**2) + self.span**2
+        A *= -3e1 * self.drag_coeff * speed * \
+            np.interp(height, self.heights, self.densities)
+        fx = A * air_vx
+        fy = A * vy
+        # the drag force acts at a local point on the rocket's axis
+        drag_fp = np.where(self.airbrakes_enabled, 1.5, -5) * self.h
+        torque = -(drag_fp - self.cog_y) * (fx * cos + fy * sin)
+        return fx, fy, torque
+
+    # burn the fuel for a time step dt (as Rocket.update_forces), returns
+    # the thrust of the engines, which is cut short when the tank runs dry,
+    # and the burned fuel
+    def burn_fuel(self, dt):
+        thrust = self.thrust * self.ignited
+        burned = np.minimum(thrust * self.FUEL_CONSUMPTION * dt, self.fuel)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            thrust = np.where(burned > 0, burned / (
+                self.FUEL_CONSUMPTION * dt), 0)
+        self.fuel -= burned
+        self.fuel_used += burned
+        return thrust, burned
+
+    # the forces of a given thrust (at the centers of gravity) and their
+    # torques (Rocket.update_forces), given the rotation of the rockets
+    def thrust_forces(self, thrust, cos, sin):
+        local_tx = thrust * np.sin(self.engine_angle)
+        local_ty = thrust * np.cos(self.engine_angle)
+        fx = local_tx * cos - local_ty * sin
+        fy = local_tx * sin + local_ty * cos
+        torque = -(self.engine_pos_y - self.cog_y) * local_tx
+        return fx, fy, torque
+
+    # remove the burned fuel from the mass properties
+    # (Rocket.update_mass_properties), given the rotation of the rockets
+    def update_mass(self, burned, cos, sin):
+        self.mass -= burned
+        self._mass_y -= self.tank_y * burned
+        self._moment -= self.tank_moment_per_mass * burned
+        # move the center of gravity, keeping the velocity of the origin
+        shift = self._mass_y / self.mass - self.cog_y
+        shift[np.abs(shift) <= self.COG_TOLERANCE] = 0
+        if shift.any():
+            self.center[:, 0] -= shift * sin
+            self.center[:, 1] += shift * cos
+            self.velocity[:, 0] -= self.angular_velocity * shift * cos
+            self.velocity[:, 1] -= self.angular_velocity * shift * sin
+            self.cog_y += shift
+        py = self.cog_y
+        self.moment = self._moment - 2 * py * self._mass_y + self.mass * py**2
+
+    # land the rockets (given by index) whose hull touches the ground at
+    # the given heights
+    def detect_touchdown(self, index, ground):
+        angle = self.angle[index]
+        points_y = self.points[:, 1] - self.cog_y[index, None]
+        hull_y = self.center[index, 1:2] + \
+            self.points[:, 0] * np.sin(angle)[:, None] + \
+            points_y * np.cos(angle)[:, None]
+        index = index[hull_y.min(axis=1) <= ground]
+        if len(index) == 0:
+            return
+        self.landed[index] = True
+        self.touchdown_velocity[index] = np.hypot(*self.velocity[index].T)
+        self.touchdown_time[index] = self.time
+        self.touchdown_angle[index] = \
+            (self.angle[index] + math.pi) % (2 * math.pi) - math.pi
+        self.velocity[index] = 0
+        self.angular_velocity[index] = 0
+        self.ignited[index] = False
+        self._gravity[index] = 0
+
+    # number of physics steps per frame (the autopilot acts once per frame)
+    def physics_steps_per_frame(self):
+        return int(1 / self.DT / self.FPS)
+
+    # update the autopilot and the physics for the duration of one frame
+    def update_frame(self):
+        self.auto_controls()
+        for _ in range(self.physics_steps_per_frame()):
+            self.update_physics()
+
+    # simulate for a given amount of time or until all rockets landed
+    def simulate(self, duration):
+        t_end = self.time + duration
+        while self.time < t_end and not self.landed.all():
+            self.update_frame()
+
+    # get the results of all rockets as a dict of arrays
+    def results(self):
+        return {
+            "landed": self.landed.copy(),
+            "fuel_used": self.fuel_used.copy(),
+            "fuel_left": self.fuel.copy(),
+            "touchdown_time": self.touchdown_time.copy(),
+            "touchdown_velocity": self.touchdown_velocity.copy(),
+            "touchdown_angle": self.touchdown_angle.copy(),
+        }